@@ -0,0 +1,134 @@
+import io
+import hashlib
+
+import numpy as np
+
+from aggregates import AggregateSnapshot, VALUE_COLUMNS, gameweek_rank
+from metrics import timed
+from schema import PICK_COLUMNS
+from state_backend import state_backend
+
+MANIFEST = 'manifest.json'
+
+
+def _table_bytes(arrays):
+    buffer = io.BytesIO()
+    np.savez(buffer, **arrays)
+    return buffer.getvalue()
+
+
+def _digest(arrays):
+    """Digest of the arrays' contents. npz bytes carry a timestamp, so are not compared directly."""
+    digest = hashlib.md5()
+    for name in sorted(arrays):
+        digest.update(f'{name}:{arrays[name].dtype.str}:{arrays[name].shape}'.encode())
+        digest.update(np.ascontiguousarray(arrays[name]).tobytes())
+    return digest.hexdigest()[:16]
+
+
+class AggregateStore:
+    """
+    Materialised aggregate tables of a league, kept in the state backend under the key prefix path, next to its
+    manager store. One table per gameweek holds the ownership and captain counts by element id, and the total points,
+    points, value, league rank and squad of every manager with a row in that gameweek. A managers table maps ids to
+    team names. Tables are written when an ingest job completes and named by their contents, so finished gameweeks
+    are only rewritten if the league changes, and a manifest naming the current tables is swapped in last.
+    """
+
+    def __init__(self, path, backend=None):
+        self.path = str(path).rstrip('/')
+        self.backend = backend or state_backend
+
+    @property
+    def manifest_key(self):
+        return f'{self.path}/{MANIFEST}'
+
+    def _table_key(self, name):
+        return f'{self.path}/{name}'
+
+    def manifest(self):
+        return self.backend.get_json(self.manifest_key)
+
+    def data_version(self):
+        """Manager store version the tables were materialised from, None if there are none"""
+        manifest = self.manifest()
+        return None if manifest is None else manifest['data_version']
+
+    @staticmethod
+    def _gameweek_arrays(snapshot, gw):
+        present = ~np.isnan(snapshot.values['total_points'][:, gw])
+        managers = snapshot.managers[present]
+        arrays = {column: snapshot.values[column][present, gw].astype(np.int32) for column in VALUE_COLUMNS}
+        arrays.update(managers=managers, rank=gameweek_rank(arrays['total_points'], managers),
+                      owners=snapshot.owners[:, gw], captains=snapshot.captains[:, gw],
+                      squads=snapshot.squads[gw][present])
+        return arrays
+
+    def write(self, snapshot, data_version):
+        """
+        Materialise the tables of snapshot
+        :param snapshot: AggregateSnapshot with squads for every gameweek, from LeagueAggregates.snapshot(squads=True)
+        :param data_version: version of the manager store the snapshot covers
+        """
+        previous = self.manifest() or {'tables': {}}
+        tables = {}
+        with timed('aggregate_store', op='write'):
+            managers_table = {'managers': snapshot.managers, 'team_names': snapshot.team_names.astype(str)}
+            for label, arrays in [('managers', managers_table)] + [
+                    (f'gw{gw}', self._gameweek_arrays(snapshot, gw)) for gw in snapshot.gameweeks()]:
+                name = f'{label}-{_digest(arrays)}.npz'
+                if name not in previous['tables'].values():
+                    self.backend.put(self._table_key(name), _table_bytes(arrays))
+                tables[label] = name
+            self.backend.put_json(self.manifest_key, {'data_version': data_version, 'version': snapshot.version,
+                                                      'tables': tables})
+            for name in set(previous['tables'].values()) - set(tables.values()):
+                self.backend.delete(self._table_key(name))
+
+    def _read_table(self, name):
+        value = self.backend.get(self._table_key(name))
+        if value is None:
+            raise KeyError(f"Aggregate table {name} replaced while reading")
+        return np.load(io.BytesIO(value), allow_pickle=False)
+
+    def read(self, squad_gws=()):
+        """
+        Assemble the tables as one AggregateSnapshot, None if there are none
+        :param squad_gws: gameweeks to also read squads for, only the correlation figure needs them
+        """
+        manifest = self.manifest()
+        if manifest is None:
+            return None
+        with timed('aggregate_store', op='read'):
+            tables = dict(manifest['tables'])
+            with self._read_table(tables.pop('managers')) as managers_table:
+                managers = managers_table['managers']
+                team_names = managers_table['team_names'].astype(object)
+            gws = sorted(int(label[2:]) for label in tables)
+            n_gws = gws[-1] + 1 if gws else 0
+            values = {column: np.full((len(managers), n_gws), np.nan) for column in VALUE_COLUMNS + ('rank',)}
+            managers_per_gw = np.zeros(n_gws, dtype=np.int32)
+            owners, captains, squads = {}, {}, {}
+            for gw in gws:
+                with self._read_table(tables[f'gw{gw}']) as table:
+                    rows = np.searchsorted(managers, table['managers'])
+                    for column in values:
+                        values[column][rows, gw] = table[column]
+                    managers_per_gw[gw] = len(rows)
+                    owners[gw], captains[gw] = table['owners'], table['captains']
+                    if gw in squad_gws:
+                        squads[gw] = np.zeros((len(managers), len(PICK_COLUMNS)), dtype=np.int16)
+                        squads[gw][rows] = table['squads']
+            return AggregateSnapshot(manifest['version'], self._grid(owners, n_gws), self._grid(captains, n_gws),
+                                     managers_per_gw, managers, team_names, values, squads)
+
+    @staticmethod
+    def _grid(counts, n_gws):
+        """(element id, gameweek) grid from each gameweek's counts"""
+        grid = np.zeros((max((len(column) for column in counts.values()), default=0), n_gws), dtype=np.int32)
+        for gw, column in counts.items():
+            grid[:len(column), gw] = column
+        return grid
+
+    def clear(self):
+        self.backend.delete_prefix(self.path + '/')
@@ -0,0 +1,259 @@
+import io
+import threading
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+from analysis import SquadMembership
+from schema import PICK_COLUMNS
+
+# Per manager, per gameweek values kept as managers x gameweeks matrices
+VALUE_COLUMNS = ('total_points', 'points', 'value')
+
+
+def _grow(counts, shape):
+    """counts zero padded to at least shape"""
+    if counts.shape[0] >= shape[0] and counts.shape[1] >= shape[1]:
+        return counts
+    grown = np.zeros((max(counts.shape[0], shape[0]), max(counts.shape[1], shape[1])), dtype=counts.dtype)
+    grown[:counts.shape[0], :counts.shape[1]] = counts
+    return grown
+
+
+def gameweek_rank(total_points, managers):
+    """League rank on total_points, ties to the lower manager id as in create_ranking_df"""
+    order = np.lexsort((managers, -total_points))
+    rank = np.empty(len(order), dtype=np.int32)
+    rank[order] = np.arange(1, len(order) + 1)
+    return rank
+
+
+class AggregateSnapshot:
+    """
+    League aggregates at a point in time, with the figure inputs derived from them.
+    Counts are (element id, gameweek) grids indexed directly by id and gameweek number, per manager values are
+    (manager, gameweek) matrices with NaN where a manager has no row. Squads, (manager x pick) element ids, are only
+    held for the gameweeks in squads.
+    """
+
+    def __init__(self, version, owners, captains, managers_per_gw, managers, team_names, values, squads=None):
+        self.version = version
+        self.owners = owners
+        self.captains = captains
+        self.managers_per_gw = managers_per_gw
+        self.managers = managers
+        self.team_names = team_names
+        # column -> managers x gameweeks matrix, for VALUE_COLUMNS and optionally a precomputed 'rank'
+        self.values = values
+        self.squads = squads or {}
+
+    @property
+    def n_managers(self):
+        return len(self.managers)
+
+    def gameweeks(self, gw_range=None):
+        """Gameweeks with at least one manager, within the inclusive gw_range"""
+        gw_values = np.flatnonzero(self.managers_per_gw)
+        if gw_range is not None:
+            gw_values = gw_values[(gw_values >= gw_range[0]) & (gw_values <= gw_range[1])]
+        return gw_values
+
+    def ownership(self, prc=True):
+        """Element ownership by gameweek, as analysis.ownership"""
+        gw_values = self.gameweeks()
+        counts = self.owners[:, gw_values].astype(float)
+        element_values = np.flatnonzero(counts.any(axis=1))
+        counts = counts[element_values]
+        if prc:
+            counts = counts / self.managers_per_gw[gw_values] * 100
+        ownership_df = pd.DataFrame(counts, index=element_values, columns=[f"gw{gw}" for gw in gw_values])
+        ownership_df.index.name = "element"
+        return ownership_df
+
+    def captain_share(self, gw):
+        """Percentage of gameweek gw captains on each element, most captained first"""
+        counts = self.captains[:, gw] if gw < self.captains.shape[1] else np.zeros(0)
+        elements = np.flatnonzero(counts)
+        order = np.argsort(-counts[elements], kind='stable')
+        share = counts[elements[order]] / counts.sum() * 100 if len(elements) else []
+        return pd.Series(share, index=elements[order], dtype=float)
+
+    def _in_range(self, gw_range):
+        """Gameweeks in gw_range and a mask of the managers with a row in any of them"""
+        gw_values = self.gameweeks(gw_range)
+        present = ~np.isnan(self.values['total_points'][:, gw_values]).all(axis=1)
+        return gw_values, present
+
+    def n_managers_in(self, gw_range=None):
+        return int(self._in_range(gw_range)[1].sum())
+
+    def timeseries(self, column, gw_range=None):
+        """Team name x gameweek values of column, as create_ranking_df with rank=False"""
+        gw_values, present = self._in_range(gw_range)
+        return pd.DataFrame(self.values[column][present][:, gw_values], index=self.team_names[present],
+                            columns=pd.Index(gw_values, name='gw'))
+
+    def running_rank(self, gw_range=None):
+        """League rank of each manager by gameweek on total points, as create_ranking_df"""
+        if 'rank' in self.values:
+            return self.timeseries('rank', gw_range)
+        gw_values, present = self._in_range(gw_range)
+        points = pd.DataFrame(self.values['total_points'][present][:, gw_values], index=self.managers[present],
+                              columns=pd.Index(gw_values, name='gw'))
+        running_rank = points.rank(ascending=False, method='first')
+        running_rank.index = self.team_names[present]
+        return running_rank
+
+    def rows(self, gw_range=None):
+        """Long form manager, team_name, gw and VALUE_COLUMNS rows, one per manager gameweek"""
+        gw_values, present = self._in_range(gw_range)
+        total_points = self.values['total_points'][present][:, gw_values]
+        has_row = ~np.isnan(total_points)
+        manager_index, gw_index = np.nonzero(has_row)
+        rows = pd.DataFrame({'manager': self.managers[present][manager_index],
+                             'team_name': self.team_names[present][manager_index],
+                             'gw': gw_values[gw_index]})
+        for column in VALUE_COLUMNS:
+            rows[column] = self.values[column][present][:, gw_values][has_row]
+        return rows
+
+    def membership(self, gw):
+        """
+        SquadMembership of the managers with a squad in gameweek gw, as index_by_element over its rows
+        :return: SquadMembership, rows also carrying total_points
+        """
+        has_squad = ~np.isnan(self.values['total_points'][:, gw])
+        squads = self.squads[gw][has_squad].astype(np.int64)
+        row_index = np.repeat(np.arange(len(squads)), squads.shape[1])
+        elements = squads.ravel()
+        picked = elements != 0
+        row_index, elements = row_index[picked], elements[picked]
+        present = np.bincount(elements) > 0 if len(elements) else np.zeros(0, dtype=bool)
+        element_values = np.flatnonzero(present)
+        matrix = sparse.csr_matrix((np.ones(len(row_index), dtype=np.uint8),
+                                    (row_index, (np.cumsum(present) - 1)[elements])),
+                                   shape=(len(squads), len(element_values)))
+        matrix.data[:] = 1
+        rows = pd.DataFrame({'manager': self.managers[has_squad], 'team_name': self.team_names[has_squad],
+                             'gw': gw, 'total_points': self.values['total_points'][has_squad, gw]})
+        return SquadMembership(matrix, element_values, rows)
+
+    def to_bytes(self):
+        """Serialised without squads, for publishing while a league loads"""
+        buffer = io.BytesIO()
+        np.savez(buffer, version=self.version, owners=self.owners, captains=self.captains,
+                 managers_per_gw=self.managers_per_gw, managers=self.managers,
+                 team_names=self.team_names.astype(str), **self.values)
+        return buffer.getvalue()
+
+    @classmethod
+    def from_bytes(cls, value):
+        with np.load(io.BytesIO(value), allow_pickle=False) as arrays:
+            values = {column: arrays[column] for column in arrays.files if column in VALUE_COLUMNS + ('rank',)}
+            return cls(int(arrays['version']), arrays['owners'], arrays['captains'], arrays['managers_per_gw'],
+                       arrays['managers'], arrays['team_names'].astype(object), values)
+
+
+class LeagueAggregates:
+    """
+    Ownership, captaincy and per gameweek values of a league, updated one manager at a time as the league loads.
+    Each manager's last contribution is kept, so adding them again replaces it and an update costs one manager's
+    rows however many managers are already counted.
+    """
+
+    def __init__(self):
+        self.version = 0
+        self._owners = np.zeros((0, 0), dtype=np.int32)
+        self._captains = np.zeros((0, 0), dtype=np.int32)
+        self._managers_per_gw = np.zeros(0, dtype=np.int32)
+        # manager -> (team name, gameweeks, squad element ids, captain element ids, VALUE_COLUMNS values)
+        self._rows = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._rows)
+
+    def _apply(self, gws, squads, captains, sign):
+        """Add (sign 1) or subtract (sign -1) rows from the counts, each grid updated with one bincount"""
+        n_gws = len(self._managers_per_gw)
+        elements = squads.ravel()
+        picked = elements != 0
+        owners = np.bincount(elements[picked] * n_gws + np.repeat(gws, squads.shape[1])[picked],
+                             minlength=self._owners.size)
+        self._owners += sign * owners.reshape(self._owners.shape).astype(np.int32)
+        captained = captains != 0
+        captains = np.bincount(captains[captained] * n_gws + gws[captained], minlength=self._captains.size)
+        self._captains += sign * captains.reshape(self._captains.shape).astype(np.int32)
+        self._managers_per_gw += sign * np.bincount(gws, minlength=n_gws).astype(np.int32)
+
+    def _remove(self, manager):
+        previous = self._rows.pop(manager, None)
+        if previous is not None:
+            self._apply(*previous[1:4], -1)
+
+    def add(self, manager_df):
+        """
+        Count one manager's rows, replacing any earlier rows of theirs
+        :param manager_df: every row of a single manager, as merged into the manager store
+        """
+        self.add_frame(manager_df)
+
+    def add_frame(self, manager_df):
+        """
+        Count the rows of any number of managers, replacing earlier rows of theirs, in one pass over the arrays
+        :param manager_df: every row of each manager included, e.g. the store contents when a reload starts
+        """
+        if manager_df.empty:
+            return
+        if not manager_df['manager'].is_monotonic_increasing:
+            manager_df = manager_df.sort_values('manager', kind='stable')
+        managers = manager_df['manager'].to_numpy(dtype=np.int64)
+        gws = manager_df['gw'].to_numpy(dtype=np.int64)
+        squads = manager_df[PICK_COLUMNS].to_numpy(dtype=np.int64, na_value=0)
+        captains = manager_df['captain'].to_numpy(dtype=np.int64, na_value=0)
+        values = manager_df[list(VALUE_COLUMNS)].to_numpy(dtype=float)
+        team_names = manager_df['team_name'].to_numpy(dtype=object)
+        starts = np.flatnonzero(np.r_[True, managers[1:] != managers[:-1]])
+        ends = np.r_[starts[1:], len(managers)]
+        with self._lock:
+            for start in starts:
+                self._remove(int(managers[start]))
+            n_gws = max(len(self._managers_per_gw), gws.max() + 1)
+            self._owners = _grow(self._owners, (squads.max(initial=0) + 1, n_gws))
+            self._captains = _grow(self._captains, (captains.max(initial=0) + 1, n_gws))
+            self._managers_per_gw = np.pad(self._managers_per_gw, (0, n_gws - len(self._managers_per_gw)))
+            self._apply(gws, squads, captains, 1)
+            for start, end in zip(starts, ends):
+                self._rows[int(managers[start])] = (team_names[end - 1], gws[start:end], squads[start:end],
+                                                    captains[start:end], values[start:end])
+            self.version += 1
+
+    def remove(self, manager):
+        with self._lock:
+            if manager in self._rows:
+                self._remove(manager)
+                self.version += 1
+
+    def snapshot(self, squads=False):
+        """
+        Copy of the aggregates so far, safe to read while loading continues
+        :param squads: also copy every gameweek's squads, for materialising the league's tables
+        """
+        with self._lock:
+            managers = np.array(sorted(self._rows), dtype=np.int64)
+            n_gws = len(self._managers_per_gw)
+            values = np.full((len(VALUE_COLUMNS), len(managers), n_gws), np.nan)
+            squad_grid = np.zeros((n_gws, len(managers), len(PICK_COLUMNS)), dtype=np.int16) if squads else None
+            team_names = np.empty(len(managers), dtype=object)
+            for i, manager in enumerate(managers):
+                team_name, gws, manager_squads, _, manager_values = self._rows[manager]
+                team_names[i] = team_name
+                values[:, i, gws] = manager_values.T
+                if squads:
+                    squad_grid[gws, i] = manager_squads
+            return AggregateSnapshot(self.version, self._owners.copy(), self._captains.copy(),
+                                     self._managers_per_gw.copy(), managers, team_names,
+                                     dict(zip(VALUE_COLUMNS, values)),
+                                     {gw: squad_grid[gw] for gw in np.flatnonzero(self._managers_per_gw)}
+                                     if squads else None)
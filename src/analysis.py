@@ -1,79 +1,141 @@
+from collections import namedtuple
+
+import numpy as np
 import pandas as pd
+from scipy import sparse
+
+from dimensions import ManagerIndex
+
+SquadMembership = namedtuple('SquadMembership', ['matrix', 'elements', 'rows'])
+
+
+def _flat_picks(manager_df, include_subs=True):
+    """
+    Flatten the P1..S4 pick columns into parallel arrays of (row position, element id), dropping missing picks.
+    :param manager_df:
+    :param include_subs:
+    :return: row_index, elements
+    """
+    picks = manager_df.loc[:, 'P1':'S4'] if include_subs else manager_df.loc[:, 'P1':'P11']
+    # Missing picks (e.g. no subs) are null, read as element 0 which is never a real id
+    elements = np.column_stack([picks[column].to_numpy(dtype=np.int64, na_value=0) for column in picks]).ravel()
+    row_index = np.repeat(np.arange(len(picks)), picks.shape[1])
+    picked = elements != 0
+    return row_index[picked], elements[picked]
 
 
 def ownership(manager_df, prc=True, include_subs=True):
     """
-    From manager_df, calculate the element percentage ownership by week
+    From manager_df, calculate the element percentage ownership by week.
+    Counts every (element, gameweek) pair in a single bincount over integer element ids.
     :param include_subs:
     :param prc:
     :param manager_df:
     :return: prc_ownership_df
     """
-    prc_ownership_df = pd.DataFrame()
-    for gw in manager_df['gw'].unique():
-        # Create percentage ownership for game week
-        if include_subs:
-            gw_df = manager_df[manager_df['gw'] == gw].loc[:, 'P1':'S4']
-        else:
-            gw_df = manager_df[manager_df['gw'] == gw].loc[:, 'P1':'P11']
-        gw_ownership = gw_df.stack().value_counts()
-        if prc:
-            gw_ownership = gw_ownership / len(gw_df) * 100
-        gw_ownership.name = f"gw{gw}"
-        # Merge into main output dataframe
-        prc_ownership_df = prc_ownership_df.merge(gw_ownership, how='outer', left_index=True, right_index=True)
-    # Fill na with 0 and rename index
-    prc_ownership_df = prc_ownership_df.fillna(0.0)
+    gw_values, row_gw_index = np.unique(manager_df['gw'].to_numpy(), return_inverse=True)
+    # Pair each pick with its row's gameweek
+    row_index, elements = _flat_picks(manager_df, include_subs)
+    gw_index = row_gw_index[row_index]
+    # Element ids are small integers, so count straight into an (element id, gameweek) grid
+    n_ids = elements.max() + 1 if len(elements) else 0
+    counts = np.bincount(elements * len(gw_values) + gw_index, minlength=n_ids * len(gw_values))
+    counts = counts.reshape(n_ids, len(gw_values)).astype(float)
+    element_values = np.flatnonzero(counts.any(axis=1))
+    counts = counts[element_values]
+    if prc:
+        managers_per_gw = np.bincount(row_gw_index, minlength=len(gw_values))
+        counts = counts / managers_per_gw * 100
+    prc_ownership_df = pd.DataFrame(counts, index=element_values, columns=[f"gw{gw}" for gw in gw_values])
     prc_ownership_df.index.name = "element"
     return prc_ownership_df
 
 
-def create_corr_matrices(element_df, gw):
+def _corr_from_gram(gram, totals, n):
     """
-    Given the manager team selection df indexed by element, create correlation matrices for both player selection
+    Pearson correlation between the columns of a binary matrix X with n rows, from its gram matrix X'X
+    and column totals. Constant columns give NaN, as in DataFrame.corr.
+    """
+    means = totals / n
+    cov = gram / n - np.outer(means, means)
+    std = np.sqrt(np.diag(cov))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        corr = cov / np.outer(std, std)
+    corr[:, std == 0] = np.nan
+    corr[std == 0, :] = np.nan
+    return corr
+
+
+def create_corr_matrices(membership, gw, managers=None):
+    """
+    Given the sparse squad membership, create correlation matrices for both player selection
     correlation and manager correlation
      i.e which players are often selected alongside others, and which managers teams are most correlated.
-    :param element_df:
+    Both are computed with sparse matrix products rather than DataFrame.corr.
+    :param membership: SquadMembership from index_by_element
     :param gw:
-    :return:
+    :param managers: optional subset of manager ids to correlate, for leagues too large for an N x N matrix
+    :return: player_corr_matrix indexed by element id, manager_corr_matrix indexed by team name
     """
-    gw_element_df = element_df[element_df['gw'] == gw].drop(columns='gw').drop(columns='manager')
-    gw_element_df = gw_element_df.loc[:, (gw_element_df.sum(axis=0) != 0)].set_index('team_name')
-    player_corr_matrix = gw_element_df.corr()
-    manager_corr_matrix = gw_element_df.transpose().corr()
+    in_gw = (membership.rows['gw'] == gw).to_numpy()
+    if managers is not None:
+        in_gw &= membership.rows['manager'].isin(managers).to_numpy()
+    gw_matrix = membership.matrix[in_gw]
+    # Only elements selected by someone in the gameweek
+    element_totals = np.asarray(gw_matrix.sum(axis=0)).ravel()
+    owned = element_totals != 0
+    gw_matrix = gw_matrix[:, owned].astype(np.float64)
+    elements = membership.elements[owned]
+    team_names = membership.rows.loc[in_gw, 'team_name']
+
+    player_gram = (gw_matrix.T @ gw_matrix).toarray()
+    player_corr = _corr_from_gram(player_gram, element_totals[owned], gw_matrix.shape[0])
+    manager_gram = (gw_matrix @ gw_matrix.T).toarray()
+    manager_totals = np.asarray(gw_matrix.sum(axis=1)).ravel()
+    manager_corr = _corr_from_gram(manager_gram, manager_totals, gw_matrix.shape[1])
+
+    player_corr_matrix = pd.DataFrame(player_corr, index=elements, columns=elements)
+    manager_corr_matrix = pd.DataFrame(manager_corr, index=team_names, columns=team_names)
     return player_corr_matrix, manager_corr_matrix
 
 
 def index_by_element(manager_df, include_subs=True):
     """
-    Transform main dataframe to be indexed by element
+    Transform main dataframe to be indexed by element, as a sparse (manager gameweek x element) membership matrix
+    built directly from the integer pick columns.
     :param include_subs:
     :param manager_df:
-    :return:
+    :return: SquadMembership of csr matrix, element id per column and manager/team_name/gw per row
     """
-    if include_subs:
-        element_df = manager_df.loc[:, 'P1':'S4'].apply(pd.value_counts, axis=1).fillna(0.0)
-    else:
-        element_df = manager_df.loc[:, 'P1':'P11'].apply(pd.value_counts, axis=1).fillna(0.0)
-    element_df = pd.concat([manager_df[['manager', 'team_name', 'gw']], element_df], axis=1)
-    return element_df
+    row_index, elements = _flat_picks(manager_df, include_subs)
+    # Element ids are small integers, so map them to dense column positions through a lookup table
+    present = np.bincount(elements) > 0 if len(elements) else np.zeros(0, dtype=bool)
+    element_values = np.flatnonzero(present)
+    element_index = (np.cumsum(present) - 1)[elements]
+    matrix = sparse.csr_matrix((np.ones(len(row_index), dtype=np.uint8), (row_index, element_index)),
+                               shape=(len(manager_df), len(element_values)))
+    # Duplicate (row, element) entries are summed on construction, membership is binary
+    matrix.data[:] = 1
+    rows = manager_df[['manager', 'team_name', 'gw']].reset_index(drop=True)
+    return SquadMembership(matrix, element_values, rows)
 
 
-def create_ranking_df(manager_df, column, rank=True):
+def create_ranking_df(manager_df, column, rank=True, manager_index=None):
     """
     Create ranking dataframes given the manager dataframe and a specific column of interest.
     One of overall rank and one for rank in each gameweek.
     If rank is false return raw values.
     :param manager_df:
+    :param manager_index: ManagerIndex for manager_df, built if not given
     :return:
     """
-    def id_to_name(m_id):
-        return manager_df[manager_df['manager'] == m_id]['team_name'].iloc[0]
+    if manager_index is None:
+        manager_index = ManagerIndex(manager_df)
 
     # Get manager rankings
     running_rank = (manager_df[['manager', 'gw', column, 'team_name']].set_index('manager')
                     .pivot(columns='gw', values=column))
     if rank:
         running_rank = running_rank.rank(ascending=False, method='first')
-    running_rank.index = running_rank.index.map(id_to_name)
+    running_rank.index = manager_index.names(running_rank.index)
     return running_rank
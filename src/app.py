@@ -2,7 +2,11 @@ import dash
 import dash_bootstrap_components as dbc
 from pathlib import Path
 
+import metrics
+
 app = dash.Dash(external_stylesheets=[dbc.themes.SUPERHERO])
 server = app.server
 
-DATA_STORE = Path().resolve().joinpath('data')
\ No newline at end of file
+DATA_STORE = Path().resolve().joinpath('data')
+
+metrics.install(server, DATA_STORE.joinpath('profiles'))
@@ -0,0 +1,514 @@
+import time
+import json
+import resource
+import tempfile
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+import plotly.graph_objects as go
+from plotly.utils import PlotlyJSONEncoder
+
+from analysis import ownership, create_ranking_df
+from dimensions import ElementIndex
+from plots import (create_graphs, create_season_graphs, create_gameweek_graphs, create_aggregate_graphs,
+                   league_ts_plot, STREAM_FIGURES)
+import fpl_api_utils
+from fpl_api_utils import scrape_manager_team, league_dataframe
+from jobs import JobManager
+from aggregates import LeagueAggregates
+from aggregate_store import AggregateStore
+from manager_store import ManagerStore
+from history_store import HistoryStore
+from bootstrap_store import BootstrapStore, bootstrap_store
+from rate_limit import TokenBucket
+from response_cache import ResponseCache
+from schema import enforce_manager_schema
+from singleflight import SingleFlight
+from state_backend import LocalFileBackend
+from stub_server import StubFPLData, StubFPLServer
+
+
+def _time_call(func, *args, **kwargs):
+    """Return wall clock seconds taken by func(*args, **kwargs)"""
+    start = time.perf_counter()
+    func(*args, **kwargs)
+    return time.perf_counter() - start
+
+
+def bench_scrape_manager_team(entry_id, gw_list, worker_counts=(1, 2, 4, 8, 16)):
+    """
+    Time scrape_manager_team for a single manager at increasing concurrency caps.
+    :param entry_id: manager id
+    :param gw_list: gameweeks to scrape
+    :param worker_counts: max_workers values to compare
+    :return: dict of max_workers -> seconds
+    """
+    results = {}
+    for workers in worker_counts:
+        results[workers] = _time_call(scrape_manager_team, entry_id, gw_list, max_workers=workers)
+        print(f"scrape_manager_team workers={workers:>3} gws={len(gw_list):>3} "
+              f"{results[workers]:.2f}s ({results[worker_counts[0]] / results[workers]:.1f}x)")
+    return results
+
+
+def bench_client_throughput(n_requests=1000, workers=64, entry_id=1, gameweek=1):
+    """
+    Uncached request throughput of the rate limited client, with retry and throttle counts.
+    Point FPL_API_URL at a local stub server (stub_server.py) configured with throttling or errors.
+    :param n_requests: requests to issue
+    :param workers: client threads issuing them
+    :param entry_id: entry whose picks are requested
+    :param gameweek: gameweek requested
+    :return: dict of requests per second and client counters for the run
+    """
+    url = fpl_api_utils.fpl_base_url + f"/entry/{entry_id}/event/{gameweek}/picks/"
+    before = dict(fpl_api_utils.request_stats)
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        list(executor.map(lambda _: fpl_api_utils._fpl_url_request(url), range(n_requests)))
+    elapsed = time.perf_counter() - start
+    results = {stat: fpl_api_utils.request_stats[stat] - before[stat] for stat in before}
+    results['requests_per_second'] = n_requests / elapsed
+    results['concurrency_limit'] = fpl_api_utils.concurrency_limiter.limit
+    print(f"client throughput {results['requests_per_second']:.0f} req/s over {n_requests} requests, "
+          f"{results['retries']} retries, {results['throttled']} throttled, "
+          f"concurrency limit {results['concurrency_limit']:.1f}")
+    return results
+
+
+def bench_ingest(league_sizes=(50, 500, 2000, 10000), n_gws=38, latency=0.02, error_rate=0.0, throttle_rate=0.0,
+                 requests_per_second=None):
+    """
+    End to end league ingest against a local stub api: standings pagination, gameweek lookup and the
+    ingest job loading every manager. Reports wall clock time, requests per second and the process peak resident
+    memory (a high water mark, so run sizes in increasing order). Each run starts from an empty response cache.
+    :param league_sizes: managers per league, each is served as the league with that id
+    :param n_gws: gameweeks played
+    :param latency: seconds the stub adds to every response
+    :param error_rate: fraction of stub responses that are 503s
+    :param throttle_rate: fraction of stub responses that are 429s
+    :param requests_per_second: override the client rate limit, None keeps REQUESTS_PER_SECOND
+    :return: dict of league size -> dict of seconds, requests, requests_per_second, peak_bytes
+    """
+    stub = StubFPLServer(StubFPLData({size: size for size in league_sizes}, n_gws), latency=latency,
+                         error_rate=error_rate, throttle_rate=throttle_rate)
+    saved = (fpl_api_utils.fpl_base_url, fpl_api_utils.response_cache, fpl_api_utils.rate_limiter)
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        fpl_api_utils.fpl_base_url = stub.start()
+        if requests_per_second:
+            fpl_api_utils.rate_limiter = TokenBucket(requests_per_second, burst=requests_per_second)
+        backend = LocalFileBackend(tmp)
+        bootstrap = BootstrapStore(backend=backend)
+        job_manager = JobManager(backend=backend, bootstrap=bootstrap,
+                                 history=HistoryStore(Path(tmp, 'history.sqlite')))
+        try:
+            for n_managers in league_sizes:
+                fpl_api_utils.response_cache = ResponseCache(Path(tmp, f'cache_{n_managers}.sqlite'))
+                requests_before = stub.requests
+                start = time.perf_counter()
+                league_df, name = league_dataframe(n_managers)
+                manager_list = list(zip(league_df['entry'].to_list(), league_df['entry_name'].to_list()))
+                gw_list = bootstrap.get().gameweeks.played(including_active=True)
+                job = job_manager.submit(n_managers, manager_list, gw_list)
+                while job.active:
+                    time.sleep(0.05)
+                elapsed = time.perf_counter() - start
+                # ru_maxrss is in kilobytes on linux
+                peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+                requests = stub.requests - requests_before
+                results[n_managers] = {'seconds': elapsed, 'requests': requests,
+                                       'requests_per_second': requests / elapsed, 'peak_bytes': peak,
+                                       'state': job.state}
+                print(f"ingest managers={n_managers:>6} {job.state} in {elapsed:.1f}s, {requests} requests "
+                      f"({requests / elapsed:.0f} req/s), peak memory {peak / 1024 ** 2:.0f} MB")
+        finally:
+            fpl_api_utils.fpl_base_url, fpl_api_utils.response_cache, fpl_api_utils.rate_limiter = saved
+            stub.stop()
+    return results
+
+
+def bench_stream(league_size=2000, n_gws=38, latency=0.02):
+    """
+    Perceived latency of a league load against a local stub api: seconds until the first streamed figures can be
+    drawn from the job's running aggregates, against seconds until the load completes.
+    :param league_size: managers in the league
+    :param n_gws: gameweeks played
+    :param latency: seconds the stub adds to every response
+    :return: dict of first_figure, complete and the managers in the first snapshot
+    """
+    stub = StubFPLServer(StubFPLData({league_size: league_size}, n_gws), latency=latency)
+    saved = (fpl_api_utils.fpl_base_url, fpl_api_utils.response_cache)
+    with tempfile.TemporaryDirectory() as tmp:
+        fpl_api_utils.fpl_base_url = stub.start()
+        fpl_api_utils.response_cache = ResponseCache(Path(tmp, 'cache.sqlite'))
+        backend = LocalFileBackend(tmp)
+        bootstrap = BootstrapStore(backend=backend)
+        job_manager = JobManager(backend=backend, bootstrap=bootstrap,
+                                 history=HistoryStore(Path(tmp, 'history.sqlite')))
+        element_index = ElementIndex(synthetic_players_df())
+        try:
+            start = time.perf_counter()
+            job = job_manager.stream(league_size, bootstrap.get().gameweeks.played(including_active=True))
+            first_figure, first_managers = None, 0
+            while job.active:
+                aggregates = job_manager.aggregates(league_size)
+                if first_figure is None and aggregates is not None and aggregates.n_managers:
+                    create_aggregate_graphs(aggregates, element_index, n_gws, figures=STREAM_FIGURES)
+                    first_figure, first_managers = time.perf_counter() - start, aggregates.n_managers
+                time.sleep(0.05)
+            complete = time.perf_counter() - start
+        finally:
+            fpl_api_utils.fpl_base_url, fpl_api_utils.response_cache = saved
+            stub.stop()
+    print(f"stream managers={league_size:>6} first figures after {first_figure or complete:.1f}s "
+          f"({first_managers} managers), complete after {complete:.1f}s")
+    return {'first_figure': first_figure, 'complete': complete, 'first_managers': first_managers}
+
+
+def bench_concurrent_viewers(viewer_counts=(1, 10, 50), league_size=100, n_gws=5, latency=0.05):
+    """
+    Viewers opening the same league at once, each loading the standings and scraping every manager, against a
+    local stub api with an empty response cache. Identical requests in flight are shared, so the api request
+    count should stay close to the single viewer count.
+    :param viewer_counts: concurrent viewers to test
+    :param league_size: managers in the league
+    :param n_gws: gameweeks scraped per manager
+    :param latency: seconds the stub adds to every response
+    :return: dict of viewers -> (seconds, api requests)
+    """
+    stub = StubFPLServer(StubFPLData({1: league_size}, n_gws), latency=latency)
+    saved = (fpl_api_utils.fpl_base_url, fpl_api_utils.response_cache)
+    results = {}
+
+    def view():
+        league_df, name = league_dataframe(1)
+        for entry_id in league_df['entry']:
+            scrape_manager_team(entry_id, list(range(1, n_gws + 1)))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        fpl_api_utils.fpl_base_url = stub.start()
+        try:
+            for viewers in viewer_counts:
+                fpl_api_utils.response_cache = ResponseCache(Path(tmp, f'cache_{viewers}.sqlite'))
+                fpl_api_utils.url_flight = SingleFlight(ttl=fpl_api_utils.SHARED_RESULT_TTL)
+                fpl_api_utils.league_flight = SingleFlight(ttl=fpl_api_utils.LEAGUE_RESULT_TTL)
+                requests_before = stub.requests
+                start = time.perf_counter()
+                with ThreadPoolExecutor(max_workers=viewers) as executor:
+                    list(executor.map(lambda i: view(), range(viewers)))
+                results[viewers] = (time.perf_counter() - start, stub.requests - requests_before)
+                print(f"viewers={viewers:>4} league={league_size} {results[viewers][0]:.1f}s "
+                      f"{results[viewers][1]} api requests")
+        finally:
+            fpl_api_utils.fpl_base_url, fpl_api_utils.response_cache = saved
+            stub.stop()
+    return results
+
+
+def _serial_league_dataframe(league_id):
+    """Standings paged one request at a time, as league_dataframe used to"""
+    all_results = []
+    page_num = 1
+    while True:
+        league_info = fpl_api_utils.get_league_data(league_id, page_num)
+        all_results += league_info['standings']['results']
+        page_num += 1
+        if not league_info['standings']['has_next']:
+            return pd.DataFrame.from_records(all_results), league_info['league']['name']
+
+
+def bench_standings(league_sizes=(50, 1000, 10000), latency=0.05):
+    """
+    Compare serial standings pagination against the pipelined pagination of league_dataframe, against a local stub
+    api with no response caching.
+    :param league_sizes: managers per league, each is served as the league with that id
+    :param latency: seconds the stub adds to every response
+    :return: dict of league size -> (serial seconds, pipelined seconds, pipelined requests)
+    """
+    stub = StubFPLServer(StubFPLData({size: size for size in league_sizes}), latency=latency)
+    saved = (fpl_api_utils.fpl_base_url, fpl_api_utils.response_cache, fpl_api_utils.url_flight)
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        fpl_api_utils.fpl_base_url = stub.start()
+        fpl_api_utils.url_flight = SingleFlight()
+        try:
+            for n_managers in league_sizes:
+                fpl_api_utils.response_cache = ResponseCache(Path(tmp, f'serial_{n_managers}.sqlite'))
+                serial = _time_call(_serial_league_dataframe, n_managers)
+                fpl_api_utils.response_cache = ResponseCache(Path(tmp, f'pipelined_{n_managers}.sqlite'))
+                requests_before = stub.requests
+                pipelined = _time_call(fpl_api_utils._league_dataframe, n_managers, None)
+                results[n_managers] = (serial, pipelined, stub.requests - requests_before)
+                print(f"standings managers={n_managers:>6} serial {serial:.2f}s pipelined {pipelined:.2f}s "
+                      f"({results[n_managers][2]} requests)")
+        finally:
+            fpl_api_utils.fpl_base_url, fpl_api_utils.response_cache, fpl_api_utils.url_flight = saved
+            stub.stop()
+    return results
+
+
+def synthetic_manager_df(n_managers, n_gws=38, n_elements=600, seed=0):
+    """
+    Random manager_df with the scraped column layout, for benchmarking analysis without the api.
+    :param n_managers: number of managers
+    :param n_gws: gameweeks per manager
+    :param n_elements: size of the player pool picks are drawn from
+    :param seed: random seed
+    :return: manager_df
+    """
+    rng = np.random.default_rng(seed)
+    n_rows = n_managers * n_gws
+    # Popularity skew so ownership looks like a real league
+    weights = rng.pareto(1.5, n_elements) + 0.01
+    picks = rng.choice(np.arange(1, n_elements + 1), size=(n_rows, 15), p=weights / weights.sum())
+    manager_df = pd.DataFrame(picks, columns=[f'P{i}' for i in range(1, 12)] + ['S1', 'S2', 'S3', 'S4'])
+    manager_df.insert(0, 'gw', np.tile(np.arange(1, n_gws + 1), n_managers))
+    manager_df.insert(1, 'points', rng.integers(10, 120, n_rows))
+    manager_df.insert(2, 'total_points', manager_df['points'].to_numpy().reshape(n_managers, n_gws).cumsum(1).ravel())
+    manager_df.insert(3, 'value', rng.integers(950, 1050, n_rows))
+    manager_df['captain'] = manager_df['P1']
+    manager_df['active_chip'] = None
+    manager_df['manager'] = np.repeat(np.arange(n_managers), n_gws)
+    manager_df['team_name'] = manager_df['manager'].map(lambda m: f'Team {m}')
+    return manager_df
+
+
+def _loop_ownership(manager_df, prc=True, include_subs=True):
+    """Previous per gameweek merge implementation of analysis.ownership, kept as the benchmark baseline"""
+    prc_ownership_df = pd.DataFrame()
+    for gw in manager_df['gw'].unique():
+        if include_subs:
+            gw_df = manager_df[manager_df['gw'] == gw].loc[:, 'P1':'S4']
+        else:
+            gw_df = manager_df[manager_df['gw'] == gw].loc[:, 'P1':'P11']
+        gw_ownership = gw_df.stack().value_counts()
+        if prc:
+            gw_ownership = gw_ownership / len(gw_df) * 100
+        gw_ownership.name = f"gw{gw}"
+        prc_ownership_df = prc_ownership_df.merge(gw_ownership, how='outer', left_index=True, right_index=True)
+    prc_ownership_df = prc_ownership_df.fillna(0.0)
+    prc_ownership_df.index.name = "element"
+    return prc_ownership_df
+
+
+def bench_ownership(league_sizes=(100, 1000, 10000)):
+    """
+    Compare analysis.ownership against the per gameweek merge baseline on synthetic leagues.
+    :param league_sizes: manager counts to test
+    :return: dict of league size -> (baseline seconds, vectorised seconds)
+    """
+    results = {}
+    for n_managers in league_sizes:
+        manager_df = synthetic_manager_df(n_managers)
+        pd.testing.assert_frame_equal(ownership(manager_df), _loop_ownership(manager_df), check_dtype=False)
+        results[n_managers] = (_time_call(_loop_ownership, manager_df), _time_call(ownership, manager_df))
+        print(f"ownership managers={n_managers:>6} loop {results[n_managers][0]:.3f}s "
+              f"vectorised {results[n_managers][1]:.3f}s ({results[n_managers][0] / results[n_managers][1]:.0f}x)")
+    return results
+
+
+def bench_schema(league_sizes=(100, 1000, 10000), n_gws=38):
+    """
+    Compare in memory and feather size of manager_df before and after enforce_manager_schema, and the ownership
+    time on each.
+    :param league_sizes: manager counts to test
+    :param n_gws: gameweeks per manager
+    :return: dict of league size -> (untyped MB, typed MB, untyped feather MB, typed feather MB)
+    """
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        for n_managers in league_sizes:
+            untyped = synthetic_manager_df(n_managers, n_gws)
+            typed = enforce_manager_schema(untyped)
+            pd.testing.assert_frame_equal(ownership(typed), ownership(untyped), check_dtype=False)
+            sizes = []
+            for name, manager_df in (('untyped', untyped), ('typed', typed)):
+                path = Path(tmp).joinpath(f'{name}-{n_managers}.feather')
+                manager_df.to_feather(path)
+                sizes += [manager_df.memory_usage(deep=True).sum() / 1e6, path.stat().st_size / 1e6]
+            results[n_managers] = (sizes[0], sizes[2], sizes[1], sizes[3])
+            print(f"schema managers={n_managers:>6} memory {sizes[0]:.1f}MB -> {sizes[2]:.1f}MB "
+                  f"feather {sizes[1]:.1f}MB -> {sizes[3]:.1f}MB "
+                  f"ownership {_time_call(ownership, untyped):.3f}s -> {_time_call(ownership, typed):.3f}s")
+    return results
+
+
+def bench_history(n_managers=10000, n_seasons=2, n_gws=38, gw=10):
+    """
+    Time the pushed down history queries for one league with n_managers members in each of n_seasons seasons,
+    against the pandas analysis on a manager_df read into memory.
+    :param n_managers: league size
+    :param n_seasons: seasons stored
+    :param n_gws: gameweeks per season
+    :param gw: gameweek for the single gameweek queries
+    :return: dict of query -> seconds
+    """
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        history = HistoryStore(Path(tmp, 'history.sqlite'))
+        for season in range(n_seasons):
+            label = f'{2020 + season}-{21 + season}'
+            manager_df = enforce_manager_schema(synthetic_manager_df(n_managers, n_gws, seed=season))
+            results[f'ingest {label}'] = _time_call(history.add_manager_rows, label, manager_df)
+            history.set_league_members(label, 1, manager_df[['manager', 'team_name']].drop_duplicates().to_numpy())
+        results['pandas ownership'] = _time_call(ownership, manager_df[manager_df['gw'] == gw])
+        results['ownership'] = _time_call(history.ownership, label, 1, gws=[gw])
+        results['season ownership'] = _time_call(history.ownership, label, 1)
+        results['captains'] = _time_call(history.captains, label, 1, gw)
+        results['ranking top 20'] = _time_call(history.ranking, label, 1, 'total_points', top_k=20)
+        results['ranking'] = _time_call(history.ranking, label, 1, 'total_points')
+        results['season history'] = _time_call(history.season_history, 1)
+    for query, seconds in results.items():
+        print(f"history managers={n_managers} {query:<18} {seconds:.3f}s")
+    return results
+
+
+def bench_aggregate_tables(league_sizes=(100, 1000, 10000), n_gws=38, gw=10):
+    """
+    Reopening a loaded league: time to draw every figure from its materialised aggregate tables, against reading
+    the manager store and running the analysis on its rows. Also times materialising the tables.
+    :param league_sizes: manager counts to test
+    :param n_gws: gameweeks per manager
+    :param gw: selected gameweek
+    :return: dict of league size -> dict of seconds
+    """
+    element_index = ElementIndex(synthetic_players_df())
+    results = {}
+    for n_managers in league_sizes:
+        manager_df = enforce_manager_schema(synthetic_manager_df(n_managers, n_gws))
+        with tempfile.TemporaryDirectory() as tmp:
+            backend = LocalFileBackend(tmp)
+            store = ManagerStore('league/manager_store', backend)
+            for manager, rows in manager_df.groupby('manager', sort=False):
+                store.append(rows, manager)
+            tables = AggregateStore('league/aggregates', backend)
+            aggregates = LeagueAggregates()
+            aggregates.add_frame(store.read())
+
+            def rows_figures():
+                stored_df = store.read()
+                return {**create_season_graphs(stored_df), **create_gameweek_graphs(stored_df, element_index, gw)}
+
+            def table_figures():
+                snapshot = tables.read(squad_gws=(gw,))
+                return create_aggregate_graphs(snapshot, element_index, gw, (1, n_gws))
+
+            results[n_managers] = {
+                'materialise': _time_call(tables.write, aggregates.snapshot(squads=True), store.version()),
+                'rows': _time_call(rows_figures),
+                'tables': _time_call(table_figures),
+            }
+        timings = results[n_managers]
+        print(f"aggregate tables managers={n_managers:>6} materialise {timings['materialise']:.2f}s, "
+              f"figures from tables {timings['tables']:.2f}s against rows {timings['rows']:.2f}s")
+    return results
+
+
+def synthetic_players_df(n_elements=600):
+    """players_df with the columns the plots read, matching synthetic_manager_df element ids"""
+    ids = np.arange(1, n_elements + 1)
+    return pd.DataFrame({'id': ids, 'web_name': [f'Player {i}' for i in ids],
+                         'team': ids % 20 + 1, 'element_type': ids % 4 + 1})
+
+
+def bench_create_graphs(league_sizes=(100, 1000, 10000), n_gws=38):
+    """
+    Time building every dashboard figure for synthetic leagues.
+    :param league_sizes: manager counts to test
+    :param n_gws: gameweeks per manager
+    :return: dict of league size -> seconds
+    """
+    element_index = ElementIndex(synthetic_players_df())
+    results = {}
+    for n_managers in league_sizes:
+        manager_df = synthetic_manager_df(n_managers, n_gws)
+        results[n_managers] = _time_call(create_graphs, manager_df, element_index, n_gws)
+        print(f"create_graphs managers={n_managers:>6} {results[n_managers]:.2f}s")
+    return results
+
+
+def bench_figure_payload(league_sizes=(20, 100, 1000), n_gws=38):
+    """
+    Compare the json payload of the full nine figure bundle with the single figure a tab renders.
+    :param league_sizes: manager counts to test
+    :param n_gws: gameweeks per manager
+    :return: dict of league size -> dict of figure id -> bytes
+    """
+    element_index = ElementIndex(synthetic_players_df())
+    results = {}
+    for n_managers in league_sizes:
+        figs = create_graphs(synthetic_manager_df(n_managers, n_gws), element_index, n_gws)
+        sizes = {fig_id: len(json.dumps(fig, cls=PlotlyJSONEncoder)) for fig_id, fig in figs.items()}
+        results[n_managers] = sizes
+        print(f"payload managers={n_managers:>6} bundle {sum(sizes.values()) / 1024:.0f} kB, per tab "
+              + ", ".join(f"{fig_id} {size / 1024:.0f} kB" for fig_id, size in sizes.items()))
+    return results
+
+
+def _iterrows_ts_plot(ts_df, title):
+    """Previous one Scatter per iterrows implementation of plots.league_ts_plot, kept as the benchmark baseline"""
+    total_points = ts_df.sort_values(by=ts_df.columns[-1], ascending=True)
+    fig = go.Figure()
+    for row in total_points.iterrows():
+        fig.add_trace(go.Scatter(x=row[1].index.to_list(), y=row[1].astype(int).to_list(),
+                                 mode='lines+markers',
+                                 name=row[0]))
+    fig.update_layout(xaxis_title='GameWeek', yaxis_title=title)
+    return fig
+
+
+def bench_league_plots(league_sizes=(10, 100, 1000, 5000), n_gws=38):
+    """
+    Figure build time and serialised size of the league points plot as manager count grows, for the previous
+    per manager traces, the bulk built (WebGL above the threshold) traces and the single NaN separated trace.
+    :param league_sizes: manager counts to test
+    :param n_gws: gameweeks per manager
+    :return: dict of league size -> dict of mode -> (seconds, bytes)
+    """
+    modes = {
+        'iterrows': lambda df: _iterrows_ts_plot(df, 'Total Points'),
+        'bulk': lambda df: league_ts_plot(df, 'Total Points'),
+        'single trace': lambda df: league_ts_plot(df, 'Total Points', single_trace=True),
+    }
+    results = {}
+    for n_managers in league_sizes:
+        total_points = create_ranking_df(synthetic_manager_df(n_managers, n_gws), 'total_points', rank=False)
+        results[n_managers] = {}
+        for mode, plot in modes.items():
+            start = time.perf_counter()
+            fig = plot(total_points)
+            elapsed = time.perf_counter() - start
+            results[n_managers][mode] = (elapsed, len(json.dumps(fig, cls=PlotlyJSONEncoder)))
+        print(f"league_ts_plot managers={n_managers:>6} " + ", ".join(
+            f"{mode} {elapsed:.2f}s {size / 1024:.0f} kB" for mode, (elapsed, size) in results[n_managers].items()))
+    return results
+
+
+if __name__ == '__main__':
+
+    bench_standings()
+
+    bench_ingest()
+
+    bench_stream()
+
+    bench_concurrent_viewers()
+
+    bench_ownership()
+
+    bench_schema()
+
+    bench_history()
+
+    bench_aggregate_tables()
+
+    bench_create_graphs()
+
+    bench_figure_payload()
+
+    bench_league_plots()
+
+    bench_scrape_manager_team(164, bootstrap_store.get().gameweeks.played())
@@ -0,0 +1,108 @@
+import time
+import json
+import hashlib
+import threading
+from collections import namedtuple
+
+import pandas as pd
+
+from fpl_api_utils import get_data, STATIC_TTL
+from dimensions import ElementIndex, GameweekStatus
+from state_backend import state_backend
+
+# Seconds between scheduled refreshes, and delay after a deadline before refreshing.
+# The delay outlasts the response cache ttl so the refresh sees post deadline data.
+REFRESH_INTERVAL = 30 * 60
+DEADLINE_GRACE = STATIC_TTL + 60
+
+SNAPSHOT_KEY = 'bootstrap/snapshot.json'
+
+BootstrapSnapshot = namedtuple('BootstrapSnapshot', ['version', 'players', 'teams', 'events', 'elements',
+                                                     'gameweeks', 'fetched_at'])
+
+
+class BootstrapStore:
+    """
+    Process wide, in memory copy of the bootstrap-static tables shared by every session.
+    A background thread refreshes it on a schedule and shortly after each gameweek deadline.
+    Readers always see a complete snapshot, a refresh swaps in a new one atomically.
+    Fetched data is published to the state backend, so workers reuse each other's fetches and agree on the version.
+    """
+
+    def __init__(self, refresh_interval=REFRESH_INTERVAL, backend=None):
+        self.refresh_interval = refresh_interval
+        self.backend = backend or state_backend
+        self._snapshot = None
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def get(self):
+        """Return the current snapshot, loading it on first use"""
+        snapshot = self._snapshot
+        if snapshot is None:
+            with self._lock:
+                if self._snapshot is None:
+                    self._snapshot = self._load(time.time() - self.refresh_interval)
+                snapshot = self._snapshot
+        return snapshot
+
+    def refresh(self, fetched_since=None):
+        """
+        Fetch bootstrap-static and swap it in, keeping the version if the content is unchanged.
+        :param fetched_since: reuse a snapshot another worker published at or after this time, default always fetch
+        """
+        snapshot = self._load(fetched_since or time.time())
+        with self._lock:
+            if self._snapshot is not None and self._snapshot.version == snapshot.version:
+                snapshot = self._snapshot._replace(fetched_at=snapshot.fetched_at)
+            self._snapshot = snapshot
+        return snapshot
+
+    def _load(self, fetched_since):
+        record = self.backend.get_json(SNAPSHOT_KEY)
+        if record is None or record['fetched_at'] < fetched_since:
+            data = get_data()
+            record = {'version': hashlib.md5(json.dumps(data, sort_keys=True).encode()).hexdigest()[:12],
+                      'fetched_at': time.time(), 'data': data}
+            self.backend.put_json(SNAPSHOT_KEY, record)
+        data = record['data']
+        players = pd.DataFrame.from_records(data['elements'])
+        events = pd.DataFrame.from_records(data['events'])
+        return BootstrapSnapshot(
+            version=record['version'],
+            players=players,
+            teams=pd.DataFrame.from_records(data['teams']),
+            events=events,
+            elements=ElementIndex(players),
+            gameweeks=GameweekStatus(events),
+            fetched_at=record['fetched_at'],
+        )
+
+    def _next_refresh(self):
+        """Time of the next refresh, the scheduled interval or just after the next deadline if sooner"""
+        snapshot = self.get()
+        next_refresh = snapshot.fetched_at + self.refresh_interval
+        if 'deadline_time_epoch' in snapshot.events:
+            upcoming = snapshot.events['deadline_time_epoch'] + DEADLINE_GRACE
+            upcoming = upcoming[upcoming > snapshot.fetched_at]
+            if len(upcoming):
+                next_refresh = min(next_refresh, float(upcoming.min()))
+        return next_refresh
+
+    def _run(self):
+        while True:
+            try:
+                next_refresh = self._next_refresh()
+                time.sleep(max(next_refresh - time.time(), 1))
+                self.refresh(fetched_since=next_refresh)
+            except Exception:
+                time.sleep(60)
+
+    def start(self):
+        """Start the background refresh thread"""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='bootstrap-refresh', daemon=True)
+            self._thread.start()
+
+
+bootstrap_store = BootstrapStore()
@@ -0,0 +1,69 @@
+from datetime import datetime, timezone
+
+import numpy as np
+import pandas as pd
+
+
+class ElementIndex:
+    """
+    Element id -> name, team and position lookups, built once per bootstrap snapshot.
+    Element ids are small integers, so each attribute is an array indexed directly by id.
+    """
+
+    def __init__(self, players_df):
+        ids = players_df['id'].to_numpy(dtype=np.int64)
+        size = ids.max() + 1 if len(ids) else 0
+        self.name = np.full(size, None, dtype=object)
+        self.name[ids] = players_df['web_name'].to_numpy()
+        self.team = np.zeros(size, dtype=np.int64)
+        self.position = np.zeros(size, dtype=np.int64)
+        if 'team' in players_df:
+            self.team[ids] = players_df['team'].to_numpy()
+        if 'element_type' in players_df:
+            self.position[ids] = players_df['element_type'].to_numpy()
+
+    def names(self, element_ids):
+        """Names for an array like of element ids"""
+        return self.name[np.asarray(element_ids, dtype=np.int64)]
+
+
+class ManagerIndex:
+    """Manager id -> team name lookup, built once per manager_df"""
+
+    def __init__(self, manager_df):
+        managers = manager_df.drop_duplicates('manager')
+        self._index = pd.Index(managers['manager'])
+        self._names = managers['team_name'].to_numpy()
+
+    def names(self, manager_ids):
+        """Team names for an array like of manager ids"""
+        return self._names[self._index.get_indexer(manager_ids)]
+
+
+class GameweekStatus:
+    """
+    Played, current and immutable gameweeks from the bootstrap events table, built once per bootstrap snapshot
+    so every question is a set or attribute lookup.
+    A gameweek is immutable once it is finished and its data checked: picks and points can no longer change.
+    The season is labelled from the first deadline, e.g. '2020-21'.
+    """
+
+    def __init__(self, events_df):
+        self.season = None
+        if 'deadline_time_epoch' in events_df and len(events_df):
+            start = datetime.fromtimestamp(int(events_df['deadline_time_epoch'].min()), tz=timezone.utc).year
+            self.season = f'{start}-{(start + 1) % 100:02d}'
+        finished = events_df['finished'].astype(bool) if 'finished' in events_df else pd.Series(False, events_df.index)
+        checked = events_df['data_checked'].astype(bool) if 'data_checked' in events_df else finished
+        current = events_df.loc[events_df['is_current'].astype(bool), 'id'] if 'is_current' in events_df else []
+        self.current = int(current.iloc[0]) if len(current) else None
+        self._finished = sorted(int(gw) for gw in events_df.loc[finished, 'id'])
+        self._active = sorted(set(self._finished) | ({self.current} if self.current else set()))
+        self._immutable = frozenset(int(gw) for gw in events_df.loc[finished & checked, 'id'])
+
+    def played(self, including_active=False):
+        """Finished gameweeks, plus the gameweek in progress if including_active"""
+        return list(self._active if including_active else self._finished)
+
+    def is_immutable(self, gameweek):
+        return gameweek in self._immutable
@@ -1,77 +1,273 @@
+import os
+import re
 import time
 import json
+import random
+import threading
+from collections import deque
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlparse
+from concurrent.futures import ThreadPoolExecutor
 
 import requests
+from requests.adapters import HTTPAdapter
 import pandas as pd
 
-fpl_base_url = r'https://fantasy.premierleague.com/api/'
+from response_cache import response_cache, FOREVER
+from rate_limit import TokenBucket, AdaptiveConcurrencyLimiter
+from metrics import registry, http_request_seconds, http_requests, http_retries
+from singleflight import SingleFlight
 
-def _fpl_url_request(url):
-    """Retrieve data from url request to fpl api"""
-    response = ''
-    while response == '':
+fpl_base_url = os.environ.get('FPL_API_URL', r'https://fantasy.premierleague.com/api/')
+
+# Cache lifetimes in seconds for responses that can still change
+STATIC_TTL = 5 * 60
+LIVE_TTL = 60
+
+# Upper bound on simultaneous requests issued by a single scrape
+MAX_WORKERS = 8
+# Standings pages requested ahead of the page being consumed, once a league turns out to have more than one page
+PAGE_PREFETCH = 4
+
+# Process wide request budget shared by every session, and the cap on requests in flight.
+# The in flight cap halves on throttling or server errors and recovers gradually on success.
+REQUESTS_PER_SECOND = 200
+MAX_CONCURRENT_REQUESTS = 32
+REQUEST_TIMEOUT = 10
+# Retries on connection errors, timeouts, 429 and 5xx, with full jitter exponential backoff
+MAX_RETRIES = 6
+BACKOFF_BASE = 0.5
+BACKOFF_CAP = 30
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+# Seconds identical requests, and league loads, share a finished result before fetching again
+SHARED_RESULT_TTL = 10
+LEAGUE_RESULT_TTL = 30
+
+rate_limiter = TokenBucket(REQUESTS_PER_SECOND, burst=REQUESTS_PER_SECOND)
+concurrency_limiter = AdaptiveConcurrencyLimiter(MAX_CONCURRENT_REQUESTS)
+request_stats = {'requests': 0, 'retries': 0, 'throttled': 0, 'errors': 0}
+_stats_lock = threading.Lock()
+# Concurrent requests for the same url (e.g. one (entry, gameweek) picks page) and loads of the same league
+# from different sessions share one fetch
+url_flight = SingleFlight(ttl=SHARED_RESULT_TTL)
+league_flight = SingleFlight(ttl=LEAGUE_RESULT_TTL, max_entries=64)
+
+registry.register_gauges('fpl_http_client', lambda: {**request_stats,
+                                                      'concurrency_limit': concurrency_limiter.limit})
+registry.register_gauges('fpl_response_cache', lambda: response_cache.stats())
+registry.register_gauges('fpl_url_singleflight', url_flight.stats)
+registry.register_gauges('fpl_league_singleflight', league_flight.stats)
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def _get_session():
+    """Return the process wide requests session, keeping connections alive between calls"""
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=4, pool_maxsize=MAX_CONCURRENT_REQUESTS)
+            _session.mount('https://', adapter)
+            _session.mount('http://', adapter)
+    return _session
+
+
+def _retry_after(response):
+    """Seconds requested by a Retry-After header, if any"""
+    value = response.headers.get('Retry-After') if response is not None else None
+    if value is None:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
         try:
-            response = requests.get(url)
-        except:
-            time.sleep(5)
+            return max(parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+        except (TypeError, ValueError):
+            return None
+
+
+def _endpoint(url):
+    """Metric label for url, with ids replaced by a placeholder"""
+    return re.sub(r'/+', '/', re.sub(r'\d+', '{id}', urlparse(url).path))
+
+
+def _count(stat):
+    with _stats_lock:
+        request_stats[stat] += 1
+
+
+def _backoff_delay(attempt):
+    return random.uniform(0, min(BACKOFF_CAP, BACKOFF_BASE * 2 ** attempt))
+
+
+def _fpl_url_request(url, ttl=0):
+    """
+    Retrieve data from url request to fpl api.
+    Requests are paced by the shared rate limiter and retried with backoff on transient failures,
+    honouring Retry-After. Responses are kept in the persistent response cache for ttl seconds,
+    ttl=0 bypasses the cache. Concurrent requests for the same url share one fetch and its parsed result.
+    """
+    return url_flight.do(url, _fetch_url, url, ttl)
+
+
+def _fetch_url(url, ttl):
+    if ttl:
+        cached = response_cache.get(url)
+        if cached is not None:
+            return json.loads(cached)
+    endpoint = _endpoint(url)
+    for attempt in range(MAX_RETRIES + 1):
+        rate_limiter.acquire()
+        response, error = None, None
+        with concurrency_limiter:
+            start = time.perf_counter()
+            try:
+                response = _get_session().get(url, timeout=REQUEST_TIMEOUT)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                error = e
+            http_request_seconds.observe(time.perf_counter() - start, endpoint=endpoint)
+        http_requests.inc(endpoint=endpoint, status=response.status_code if response is not None else 'error')
+        _count('requests')
+        if response is not None and response.status_code not in RETRY_STATUS:
+            concurrency_limiter.record_success()
+            break
+        concurrency_limiter.record_failure()
+        if response is not None and response.status_code == 429:
+            _count('throttled')
+        else:
+            _count('errors')
+        if attempt == MAX_RETRIES:
+            if error is not None:
+                raise error
+            break
+        _count('retries')
+        http_retries.inc(endpoint=endpoint)
+        delay = _backoff_delay(attempt)
+        retry_after = _retry_after(response)
+        if retry_after is not None:
+            # Hold back every caller, not just this one
+            rate_limiter.pause(retry_after)
+            delay = max(delay, retry_after)
+        time.sleep(delay)
     if response.status_code != 200:
         response.raise_for_status()
+    if ttl:
+        response_cache.set(url, response.text, ttl)
     data = json.loads(response.text)
     return data
 
 def get_league_data(leagueId, page_num=1):
     url = fpl_base_url + f'/leagues-classic/{leagueId}/standings?page_standings={page_num}'
-    return _fpl_url_request(url)
+    return _fpl_url_request(url, ttl=STATIC_TTL)
 
 
 def get_data():
     url = fpl_base_url + '/bootstrap-static/'
-    return _fpl_url_request(url)
+    return _fpl_url_request(url, ttl=STATIC_TTL)
 
 
 def get_fixtures_data():
     url = fpl_base_url + "/fixtures/"
-    return _fpl_url_request(url)
+    return _fpl_url_request(url, ttl=STATIC_TTL)
 
 
-def get_entry_picks(entry_id, gameweek):
+def get_entry_picks(entry_id, gameweek, immutable=False):
+    """Picks of entry_id in gameweek, cached forever once the gameweek is immutable"""
     url = fpl_base_url + f"/entry/{entry_id}/event/{gameweek}/picks/"
-    return _fpl_url_request(url)
+    return _fpl_url_request(url, ttl=FOREVER if immutable else LIVE_TTL)
+
+
+def iter_league_pages(league_id, prefetch=PAGE_PREFETCH):
+    """
+    Yield the standings pages of a league in order, as they arrive.
+    Page 1 is requested alone, so single page leagues cost one request. After that up to prefetch pages are in
+    flight, and speculative requests past the last page are discarded.
+    :param league_id: classic league id
+    :param prefetch: pages requested ahead
+    :return: generator of standings payloads
+    """
+    page = get_league_data(league_id, 1)
+    yield page
+    if not page['standings']['has_next']:
+        return
+    executor = ThreadPoolExecutor(max_workers=prefetch, thread_name_prefix='standings')
+    next_page = 2
+    futures = deque()
+    try:
+        while True:
+            while len(futures) < prefetch:
+                futures.append(executor.submit(get_league_data, league_id, next_page))
+                next_page += 1
+            page = futures.popleft().result()
+            yield page
+            if not page['standings']['has_next']:
+                return
+    finally:
+        for future in futures:
+            future.cancel()
+        executor.shutdown(wait=False)
 
 
 def league_dataframe(league_id, manager_limit=None):
+    """
+    Standings of every manager in a league and the league name.
+    Sessions loading the same league at the same time share one load, and its result for LEAGUE_RESULT_TTL.
+    The returned DataFrame is shared and must not be modified.
+    """
+    return league_flight.do((league_id, manager_limit), _league_dataframe, league_id, manager_limit)
+
+
+def _league_dataframe(league_id, manager_limit):
     all_results = []
-    page_num = 1
-    while True:
-        league_info = get_league_data(league_id, page_num)
+    name = None
+    pages = iter_league_pages(league_id)
+    for league_info in pages:
+        name = league_info['league']['name']
         all_results += league_info['standings']['results']
-        page_num += 1
-        if not league_info['standings']['has_next']:
-            league_df = pd.DataFrame.from_records(all_results)
-            break
-        elif manager_limit and manager_limit < len(all_results):
-            league_df = pd.DataFrame.from_records(all_results).head(manager_limit)
+        if manager_limit and manager_limit < len(all_results):
+            pages.close()
             break
+    league_df = pd.DataFrame.from_records(all_results)
+    return (league_df.head(manager_limit) if manager_limit else league_df), name
 
-    return league_df, league_info['league']['name']
-
-
-def scrape_manager_team(entry_id, gw_list):
-    entry_data_list = []
-    for gw in gw_list:
-        # Request data
-        entry_picks = get_entry_picks(entry_id, gw)
-        # Create dict
-        gw_data = entry_picks['entry_history']
-        captain = None
-        for pick in entry_picks['picks']:
-            gw_data[f'P{pick["position"]}'] = pick['element']
-            if pick['is_captain']:
-                captain = pick['element']
-        # Add other to dict
-        gw_data['captain'] = captain
-        gw_data['active_chip'] = entry_picks['active_chip']
-        entry_data_list.append(gw_data)
+
+def _parse_entry_picks(entry_picks):
+    """Flatten a picks response into a single row dict"""
+    # Copy, the response may be shared with other callers
+    gw_data = dict(entry_picks['entry_history'])
+    captain = None
+    for pick in entry_picks['picks']:
+        gw_data[f'P{pick["position"]}'] = pick['element']
+        if pick['is_captain']:
+            captain = pick['element']
+    # Add other to dict
+    gw_data['captain'] = captain
+    gw_data['active_chip'] = entry_picks['active_chip']
+    return gw_data
+
+
+def scrape_manager_team(entry_id, gw_list, max_workers=MAX_WORKERS, immutable_gws=frozenset()):
+    """
+    Scrape a managers picks for every gameweek in gw_list.
+    Gameweeks are requested concurrently over the shared session, up to max_workers at a time.
+    :param entry_id: manager id
+    :param gw_list: gameweeks to request
+    :param max_workers: concurrency cap, 1 requests serially
+    :param immutable_gws: gameweeks whose picks can be cached forever
+    :return: DataFrame with one row per gameweek
+    """
+    def get_picks(gw):
+        return get_entry_picks(entry_id, gw, immutable=gw in immutable_gws)
+
+    if max_workers <= 1 or len(gw_list) <= 1:
+        all_picks = [get_picks(gw) for gw in gw_list]
+    else:
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(gw_list))) as executor:
+            all_picks = list(executor.map(get_picks, gw_list))
+    entry_data_list = [_parse_entry_picks(entry_picks) for entry_picks in all_picks]
     output_df = pd.DataFrame.from_records(entry_data_list)
     output_df = output_df.rename(columns={'P12': 'S1',
                                           'P13': 'S2',
@@ -81,17 +277,6 @@ def scrape_manager_team(entry_id, gw_list):
 
     return output_df
 
-def get_played_gameweeks(including_active=False):
-    fixtures = get_fixtures_data()
-    fixtures_df = pd.DataFrame.from_records(fixtures)
-    grby = fixtures_df.groupby(by='event').mean()
-    if including_active:
-        gw_list = grby[grby['finished'] > 0].index.to_list()
-    else:
-        gw_list = grby[grby['finished'] == 1].index.to_list()
-    return [int(gw) for gw in gw_list]
-
-
 def get_bootstrap_static_dataframes():
     data = get_data()
     teams_df = pd.DataFrame.from_records(data['teams'])
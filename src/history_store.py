@@ -0,0 +1,250 @@
+import sqlite3
+import threading
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+from app import DATA_STORE
+from analysis import SquadMembership
+from metrics import timed
+from schema import MANAGER_SCHEMA, PICK_COLUMNS
+
+HISTORY_PATH = DATA_STORE.joinpath('history.sqlite')
+
+# manager_df columns kept per (season, manager, gameweek), picks are stored long in their own table
+ROW_COLUMNS = [column for column in MANAGER_SCHEMA if column not in PICK_COLUMNS and column != 'manager']
+RANKING_COLUMNS = {'points', 'total_points', 'rank', 'overall_rank', 'value', 'bank', 'points_on_bench'}
+
+SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS manager_gameweeks (
+    season TEXT NOT NULL,
+    manager INTEGER NOT NULL,
+    {', '.join(f'{column} {"TEXT" if column in ("active_chip", "team_name") else "INTEGER"}'
+               for column in ROW_COLUMNS)},
+    PRIMARY KEY (season, manager, gw)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS manager_gameweeks_gw ON manager_gameweeks (season, gw);
+CREATE TABLE IF NOT EXISTS picks (
+    season TEXT NOT NULL,
+    manager INTEGER NOT NULL,
+    gw INTEGER NOT NULL,
+    position INTEGER NOT NULL,
+    element INTEGER NOT NULL,
+    PRIMARY KEY (season, gw, manager, position)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS league_members (
+    season TEXT NOT NULL,
+    league_id INTEGER NOT NULL,
+    manager INTEGER NOT NULL,
+    team_name TEXT,
+    PRIMARY KEY (season, league_id, manager)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS league_members_manager ON league_members (manager);
+CREATE TABLE IF NOT EXISTS bootstrap_snapshots (
+    season TEXT NOT NULL,
+    version TEXT NOT NULL,
+    fetched_at REAL NOT NULL,
+    players TEXT NOT NULL,
+    teams TEXT NOT NULL,
+    events TEXT NOT NULL,
+    PRIMARY KEY (season, version)
+);
+"""
+
+
+class HistoryStore:
+    """
+    Long lived, multi season store of ingested manager gameweeks, their picks, league membership and bootstrap
+    snapshots, in sqlite. Ingest jobs write to it, and the analysis queries below run inside sqlite against its
+    indexes so only aggregates come back to pandas. Each thread has its own connection, readers do not wait on
+    the writer in WAL mode.
+    """
+
+    def __init__(self, path=HISTORY_PATH):
+        self.path = Path(path)
+        self._local = threading.local()
+        self._write_lock = threading.Lock()
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(str(self.path), timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            # Commits are durable at the next checkpoint rather than each one syncing, ingest commits per manager
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(SCHEMA)
+            self._local.conn = conn
+        return conn
+
+    def _query(self, sql, params=()):
+        with timed('history_store', op='query'):
+            return self._connect().execute(sql, params).fetchall()
+
+    def add_manager_rows(self, season, manager_df):
+        """Insert or replace the gameweek rows and picks of manager_df, tagged with manager and team_name"""
+        if manager_df.empty:
+            return
+        n_rows = len(manager_df)
+        rows = zip([season] * n_rows, *(manager_df[column].to_numpy(dtype=object, na_value=None)
+                                        if column in manager_df else [None] * n_rows
+                                        for column in ['manager'] + ROW_COLUMNS))
+        picks = manager_df[PICK_COLUMNS].to_numpy(dtype=np.float64, na_value=np.nan)
+        row_index, position = np.nonzero(~np.isnan(picks))
+        managers = manager_df['manager'].to_numpy(dtype=np.int64)
+        gws = manager_df['gw'].to_numpy(dtype=np.int64)
+        with self._write_lock, timed('history_store', op='write'):
+            conn = self._connect()
+            with conn:
+                placeholders = ', '.join('?' * (len(ROW_COLUMNS) + 2))
+                conn.executemany(f"INSERT OR REPLACE INTO manager_gameweeks VALUES ({placeholders})", rows)
+                conn.executemany("DELETE FROM picks WHERE season = ? AND manager = ? AND gw = ?",
+                                 zip([season] * n_rows, managers.tolist(), gws.tolist()))
+                conn.executemany("INSERT INTO picks VALUES (?, ?, ?, ?, ?)",
+                                 zip([season] * len(row_index), managers[row_index].tolist(),
+                                     gws[row_index].tolist(), (position + 1).tolist(),
+                                     picks[row_index, position].astype(np.int64).tolist()))
+
+    def set_league_members(self, season, league_id, manager_list):
+        """Replace the membership of league_id in season with manager_list of (manager id, team name)"""
+        with self._write_lock:
+            conn = self._connect()
+            with conn:
+                conn.execute("DELETE FROM league_members WHERE season = ? AND league_id = ?", (season, league_id))
+                conn.executemany("INSERT INTO league_members VALUES (?, ?, ?, ?)",
+                                 ((season, league_id, int(manager), name) for manager, name in manager_list))
+
+    def add_bootstrap(self, season, snapshot):
+        """Keep a BootstrapSnapshot, once per version"""
+        if self._query("SELECT 1 FROM bootstrap_snapshots WHERE season = ? AND version = ?",
+                       (season, snapshot.version)):
+            return
+        with self._write_lock:
+            conn = self._connect()
+            with conn:
+                conn.execute("INSERT OR IGNORE INTO bootstrap_snapshots VALUES (?, ?, ?, ?, ?, ?)",
+                             (season, snapshot.version, snapshot.fetched_at,
+                              snapshot.players.to_json(orient='records'), snapshot.teams.to_json(orient='records'),
+                              snapshot.events.to_json(orient='records')))
+
+    def seasons(self):
+        return [row[0] for row in self._query("SELECT DISTINCT season FROM manager_gameweeks ORDER BY season")]
+
+    def league_managers(self, season, league_id):
+        """Manager id -> team name for a league in a season"""
+        return dict(self._query("SELECT manager, team_name FROM league_members WHERE season = ? AND league_id = ?",
+                                (season, league_id)))
+
+    @staticmethod
+    def _gw_filter(gws, column):
+        if gws is None:
+            return '', []
+        gws = [int(gw) for gw in gws]
+        return f" AND {column} IN ({', '.join('?' * len(gws))})", gws
+
+    def ownership(self, season, league_id, prc=True, include_subs=True, gws=None):
+        """
+        analysis.ownership for a league, counted in sqlite.
+        :param season: season label
+        :param league_id: league to count over
+        :param prc: percentage of the league's managers rather than counts
+        :param include_subs: count bench picks
+        :param gws: gameweeks to include, default all
+        :return: prc_ownership_df indexed by element with a gw<n> column per gameweek
+        """
+        gw_sql, gw_params = self._gw_filter(gws, 'p.gw')
+        counts = pd.DataFrame(self._query(
+            f"""SELECT p.element, p.gw, COUNT(*) FROM league_members m
+                JOIN picks p ON p.season = m.season AND p.manager = m.manager
+                WHERE m.season = ? AND m.league_id = ?{'' if include_subs else ' AND p.position <= 11'}{gw_sql}
+                GROUP BY p.element, p.gw""", [season, league_id] + gw_params), columns=['element', 'gw', 'count'])
+        own_df = counts.pivot(index='element', columns='gw', values='count').fillna(0).astype(float)
+        if prc:
+            gw_sql, gw_params = self._gw_filter(gws, 'r.gw')
+            managers = dict(self._query(
+                f"""SELECT r.gw, COUNT(*) FROM league_members m
+                    JOIN manager_gameweeks r ON r.season = m.season AND r.manager = m.manager
+                    WHERE m.season = ? AND m.league_id = ?{gw_sql} GROUP BY r.gw""", [season, league_id] + gw_params))
+            own_df = own_df / pd.Series(managers).reindex(own_df.columns).to_numpy() * 100
+        own_df.columns = [f"gw{gw}" for gw in own_df.columns]
+        own_df.columns.name = None
+        return own_df
+
+    def captains(self, season, league_id, gw):
+        """Captain counts by element id for a league gameweek, most captained first"""
+        return pd.Series(dict(self._query(
+            """SELECT r.captain, COUNT(*) AS n FROM league_members m
+               JOIN manager_gameweeks r ON r.season = m.season AND r.manager = m.manager
+               WHERE m.season = ? AND m.league_id = ? AND r.gw = ? AND r.captain IS NOT NULL
+               GROUP BY r.captain ORDER BY n DESC""", (season, league_id, gw))), dtype=float)
+
+    def ranking(self, season, league_id, column, rank=True, top_k=None):
+        """
+        analysis.create_ranking_df for a league, with the per gameweek ranking done by a sqlite window function.
+        Ties are broken by manager id.
+        :param top_k: only return the top_k managers by total points, still ranked within the whole league
+        :return: DataFrame indexed by team name with a column per gameweek
+        """
+        if column not in RANKING_COLUMNS:
+            raise ValueError(f"Cannot rank by {column}")
+        value = f"ROW_NUMBER() OVER (PARTITION BY r.gw ORDER BY r.{column} DESC, r.manager)" if rank else f"r.{column}"
+        sql = f"""SELECT m.manager, m.team_name, r.gw, {value} AS value FROM league_members m
+                  JOIN manager_gameweeks r ON r.season = m.season AND r.manager = m.manager
+                  WHERE m.season = ? AND m.league_id = ?"""
+        params = [season, league_id]
+        if top_k is not None:
+            sql = f"""SELECT * FROM ({sql}) WHERE manager IN (
+                        SELECT r.manager FROM league_members m
+                        JOIN manager_gameweeks r ON r.season = m.season AND r.manager = m.manager
+                        WHERE m.season = ? AND m.league_id = ?
+                        AND r.gw = (SELECT MAX(gw) FROM manager_gameweeks WHERE season = ?)
+                        ORDER BY r.total_points DESC, r.manager LIMIT ?)"""
+            params += [season, league_id, season, top_k]
+        ranks = pd.DataFrame(self._query(sql, params), columns=['manager', 'team_name', 'gw', column])
+        running_rank = ranks.pivot(index='manager', columns='gw', values=column).astype(float)
+        running_rank.index = ranks.drop_duplicates('manager').set_index('manager')['team_name'][running_rank.index]
+        running_rank.index.name = None
+        running_rank.columns.name = None
+        return running_rank
+
+    def squad_membership(self, season, league_id, gw, managers=None, include_subs=True):
+        """
+        analysis.index_by_element for one league gameweek, read straight from the picks table, for
+        analysis.create_corr_matrices.
+        :param managers: optional subset of manager ids
+        """
+        manager_sql = f" AND m.manager IN ({', '.join('?' * len(managers))})" if managers is not None else ''
+        picks = pd.DataFrame(self._query(
+            f"""SELECT p.manager, m.team_name, p.element FROM league_members m
+                JOIN picks p ON p.season = m.season AND p.manager = m.manager
+                WHERE m.season = ? AND m.league_id = ? AND p.gw = ?{'' if include_subs else ' AND p.position <= 11'}
+                {manager_sql} ORDER BY p.manager""",
+            [season, league_id, gw] + [int(manager) for manager in managers or []]),
+            columns=['manager', 'team_name', 'element'])
+        rows = picks.drop_duplicates('manager')[['manager', 'team_name']].reset_index(drop=True).assign(gw=gw)
+        row_index = pd.Index(rows['manager']).get_indexer(picks['manager'])
+        elements, element_index = np.unique(picks['element'].to_numpy(), return_inverse=True)
+        matrix = sparse.csr_matrix((np.ones(len(row_index), dtype=np.uint8), (row_index, element_index)),
+                                   shape=(len(rows), len(elements)))
+        matrix.data[:] = 1
+        return SquadMembership(matrix, elements, rows)
+
+    def season_history(self, league_id):
+        """
+        Final total points in every stored season of each manager who has been in league_id in any season.
+        :param league_id: league whose members, past and present, to include
+        :return: DataFrame indexed by manager with a column per season
+        """
+        totals = pd.DataFrame(self._query(
+            """SELECT r.manager, r.season, r.total_points FROM manager_gameweeks r
+               JOIN (SELECT season, manager, MAX(gw) AS gw FROM manager_gameweeks
+                     WHERE manager IN (SELECT manager FROM league_members WHERE league_id = ?)
+                     GROUP BY season, manager) last
+               ON r.season = last.season AND r.manager = last.manager AND r.gw = last.gw""", (league_id,)),
+            columns=['manager', 'season', 'total_points'])
+        return totals.pivot(index='manager', columns='season', values='total_points')
+
+
+history_store = HistoryStore()
@@ -1,6 +1,4 @@
 import uuid
-import time
-import shutil
 
 import dash_html_components as html
 import dash_bootstrap_components as dbc
@@ -8,9 +6,11 @@ from dash.dependencies import Input, Output, State
 from dash.exceptions import PreventUpdate
 import dash_core_components as dcc
 
-from app import app, DATA_STORE
+from app import app, server
 from layouts import control_tabs, analysis
-from fpl_api_utils import get_bootstrap_static_dataframes
+from bootstrap_store import bootstrap_store
+from session_store import session_store
+from metrics import timed_callback
 
 header = dbc.Row(
     [
@@ -24,76 +24,63 @@ header = dbc.Row(
     id="header"
 )
 
-app.layout = dbc.Container(
-    [
-        html.Div(str(uuid.uuid4()), id='session_id', style={'display': 'none'}),
-        html.Div(id='data_store_success', style={'display': 'none'}),
-        dcc.Store(id="fpl-data-paths"),
-        header,
-        # dbc.Row(
-        #     [
-        dbc.Col(
-            control_tabs,
-            width=12
-        ),
-        dbc.Col(
-            analysis,
-            width=12
-        )
-        #     ]
-        # ),
-    ],
-    fluid=True
-)
+def serve_layout():
+    """Layout is built per page load so every session gets its own session id"""
+    return dbc.Container(
+        [
+            html.Div(str(uuid.uuid4()), id='session_id', style={'display': 'none'}),
+            html.Div(id='data_store_success', style={'display': 'none'}),
+            dcc.Store(id="bootstrap-version"),
+            header,
+            # dbc.Row(
+            #     [
+            dbc.Col(
+                control_tabs,
+                width=12
+            ),
+            dbc.Col(
+                analysis,
+                width=12
+            )
+            #     ]
+            # ),
+        ],
+        fluid=True
+    )
+
+
+app.layout = serve_layout
 
 
 @app.callback(
     Output('data_store_success', "children"),
     [Input("session_id", "children")]
 )
+@timed_callback
 def create_session_store(session_id):
-    def reset_datastore():
-        time_stamps = DATA_STORE.glob(r'*\*.txt')
-        for ts in time_stamps:
-            creation_time = float(ts.stem)
-            if (time.time() - creation_time) > 5 * 60:
-                shutil.rmtree(ts.parent, ignore_errors=True)
-
-    session_store = DATA_STORE.joinpath(session_id)
-    if not session_store.exists():
-        session_store.mkdir(parents=True, exist_ok=True)
-        ts = session_store.joinpath(f'{time.time()}.txt')
-        with open(ts, 'w') as fh:
-            pass
-    reset_datastore()
-    if session_store.exists():
-        return True
-    else:
-        return False
+    """
+    Register the session with the session store. Its directory is created and old sessions are cleaned up by the
+    store's background janitor, so the first page load does not wait on the disk.
+    """
+    session_store.touch(session_id)
+    return True
 
 
 @app.callback(
-    Output("fpl-data-paths", "data"),
-    [Input('data_store_success', "children"), State("session_id", "children")],
+    Output("bootstrap-version", "data"),
+    [Input('data_store_success', "children")],
     prevent_initial_call=True
 )
-def retrieve_player_data(trigger, session_id):
+@timed_callback
+def retrieve_player_data(trigger):
+    """Make sure the shared bootstrap snapshot is loaded and record its version for the session"""
     if trigger is None:
         raise PreventUpdate
-    paths = {
-        'players': DATA_STORE.joinpath(session_id, 'players.feather'),
-        'teams': DATA_STORE.joinpath(session_id, 'teams.feather'),
-        'events': DATA_STORE.joinpath(session_id, 'events.feather'),
-    }
-    if not all([path.exists() for path in paths.values()]):
-        players, teams, events = get_bootstrap_static_dataframes()
-
-        players.to_feather(paths['players'])
-        teams.to_feather(paths['teams'])
-        events.to_feather(paths['events'])
+    return bootstrap_store.get().version
 
-    return {item[0]: str(item[1]) for item in paths.items()}
 
+bootstrap_store.start()
+session_store.start()
 
 
 if __name__ == '__main__':
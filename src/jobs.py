@@ -0,0 +1,322 @@
+import os
+import json
+import time
+import socket
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from aggregates import LeagueAggregates, AggregateSnapshot
+from aggregate_store import AggregateStore
+from fpl_api_utils import scrape_manager_team, iter_league_pages
+from bootstrap_store import bootstrap_store
+from history_store import history_store
+from manager_store import ManagerStore
+from state_backend import state_backend
+
+# Managers scraped at once across all jobs, each scrape also fetches its gameweeks concurrently
+JOB_WORKERS = 4
+# Seconds a completed job is reused before a new request refreshes the league
+REFRESH_AFTER = 60
+# Seconds between job progress updates in the state backend. The job's lease is renewed on each update and lapses
+# after JOB_LEASE_TTL, letting another worker take over the league if this one dies.
+PUBLISH_INTERVAL = 0.5
+JOB_LEASE_TTL = 60
+# Seconds between snapshots of a loading league's running aggregates, each one refreshes the streamed figures
+STREAM_INTERVAL = 2
+
+QUEUED, RUNNING, COMPLETE, FAILED = 'queued', 'running', 'complete', 'failed'
+
+
+def _request_key(manager_list, gw_list):
+    """Digest identifying the managers and gameweeks a job loads"""
+    request = [[list(manager) for manager in manager_list], list(gw_list)]
+    return hashlib.md5(json.dumps(request).encode()).hexdigest()
+
+
+class IngestJob:
+    """
+    Load of every manager in a league into the league's shared manager store.
+    Loads are incremental: only (manager, gameweek) pairs missing from the store, and gameweeks still in play,
+    are fetched. Managers who have left the league are dropped and new joiners are loaded in full.
+    The manager list is either given up front or streamed from the league's standings pages as they arrive.
+    Loaded rows and the final membership are also recorded in the season's history.
+    Running aggregates over the managers loaded so far are published every STREAM_INTERVAL, so figures can be
+    drawn before the load completes. On completion they are materialised as the league's aggregate tables.
+    """
+
+    def __init__(self, league_id, manager_list, gw_list, store_path, tables_path, backend, owner, gameweeks,
+                 history):
+        self.league_id = league_id
+        self.manager_list = [tuple(manager) for manager in manager_list or []]
+        self.gw_list = list(gw_list)
+        # Stored rows for immutable gameweeks are never refetched, and their responses are cached forever
+        self.immutable_gws = frozenset(gw for gw in self.gw_list if gameweeks.is_immutable(gw))
+        self.season = gameweeks.season
+        self.history = history
+        # Known once every manager is queued
+        self.request_key = None
+        self.sealed = False
+        self.store = ManagerStore(store_path, backend)
+        self.tables = AggregateStore(tables_path, backend)
+        self.aggregates = LeagueAggregates()
+        self.aggregates_version = None
+        self.aggregates_published_at = 0.0
+        self.aggregates_published_managers = 0
+        self.backend = backend
+        self.owner = owner
+        self.published_at = 0.0
+        self.state = QUEUED
+        self.done = 0
+        self.error = None
+        self.started_at = time.time()
+        self.finished_at = None
+        self._lock = threading.Lock()
+        self._publish_lock = threading.Lock()
+
+    @property
+    def total(self):
+        return len(self.manager_list)
+
+    @property
+    def active(self):
+        return self.state in (QUEUED, RUNNING)
+
+    def matches(self, manager_list, gw_list):
+        return self.request_key == _request_key(manager_list, gw_list)
+
+    def start(self, executor, pages=None):
+        """
+        Queue every manager on executor.
+        :param executor: ingest worker pool
+        :param pages: iterable of standings payloads to take managers from as they arrive, instead of manager_list
+        """
+        stored = self.store.stored_gameweeks()
+        live_gws = set(self.gw_list) - self.immutable_gws
+        if stored:
+            # Managers with nothing to fetch are never merged, count their stored rows up front
+            self.aggregates.add_frame(self.store.read())
+        self.publish()
+        if pages is None:
+            self._queue(executor, self.manager_list, stored, live_gws)
+            self._seal(stored)
+        else:
+            threading.Thread(target=self._stream, args=(executor, pages, stored, live_gws),
+                             name=f'standings-{self.league_id}', daemon=True).start()
+
+    def _queue(self, executor, managers, stored, live_gws):
+        for entry_id, entry_name in managers:
+            stored_name, stored_gws = stored.get(entry_id, (None, set()))
+            missing_gws = [gw for gw in self.gw_list if gw not in stored_gws or gw in live_gws]
+            executor.submit(self._process_manager, entry_id, entry_name, missing_gws, stored_name != entry_name)
+
+    def _stream(self, executor, pages, stored, live_gws):
+        try:
+            for page in pages:
+                managers = [(result['entry'], result['entry_name']) for result in page['standings']['results']]
+                with self._lock:
+                    self.manager_list += managers
+                self._queue(executor, managers, stored, live_gws)
+        except Exception as e:
+            self.error = f"{type(e).__name__}: {e}"
+            self._finish(FAILED)
+            return
+        self._seal(stored)
+
+    def _seal(self, stored):
+        """Every manager is queued: drop managers who left the league and complete if nothing is outstanding"""
+        self.request_key = _request_key(self.manager_list, self.gw_list)
+        members = {entry_id for entry_id, entry_name in self.manager_list}
+        for manager in set(stored) - members:
+            self.store.remove(manager)
+            self.aggregates.remove(manager)
+        self.history.set_league_members(self.season, self.league_id, self.manager_list)
+        with self._lock:
+            self.sealed = True
+            if self.state != FAILED and self.done == self.total:
+                self._finish(COMPLETE)
+
+    def _process_manager(self, entry_id, entry_name, gw_list, renamed):
+        if self.state == FAILED:
+            return
+        self.state = RUNNING
+        if time.time() - self.published_at > PUBLISH_INTERVAL:
+            self.publish()
+        try:
+            if gw_list or renamed:
+                manager_df = scrape_manager_team(entry_id, gw_list, immutable_gws=self.immutable_gws)
+                manager_df = self.store.merge(manager_df, entry_id, entry_name)
+                self.aggregates.add(manager_df)
+                self.history.add_manager_rows(self.season, manager_df)
+        except Exception as e:
+            self.error = f"{type(e).__name__}: {e}"
+            self._finish(FAILED)
+            return
+        with self._lock:
+            self.done += 1
+            if self.sealed and self.done == self.total:
+                self._finish(COMPLETE)
+        if time.time() - self.published_at > PUBLISH_INTERVAL:
+            self.publish()
+
+    def _finish(self, state):
+        if state == COMPLETE:
+            try:
+                self.tables.write(self.aggregates.snapshot(squads=True), self.store.version())
+            except Exception as e:
+                self.error = f"{type(e).__name__}: {e}"
+                state = FAILED
+        self.state = state
+        self.finished_at = time.time()
+        self.publish()
+        self.backend.release(JobManager.lease_key(self.league_id), self.owner)
+
+    def publish(self):
+        """Write progress to the state backend for other workers, renewing the job's lease"""
+        # Serialised so a slow update never overwrites the final state
+        with self._publish_lock:
+            self.published_at = time.time()
+            if self.active:
+                self.backend.claim(JobManager.lease_key(self.league_id), self.owner, JOB_LEASE_TTL)
+            # The first managers are published straight away, later ones every STREAM_INTERVAL
+            if self.aggregates.version != self.aggregates_version and (
+                    not self.active or not self.aggregates_published_managers
+                    or self.published_at - self.aggregates_published_at > STREAM_INTERVAL):
+                snapshot = self.aggregates.snapshot()
+                self.backend.put(JobManager.aggregates_key(self.league_id), snapshot.to_bytes())
+                self.aggregates_version = snapshot.version
+                self.aggregates_published_at = self.published_at
+                self.aggregates_published_managers = snapshot.n_managers
+            self.backend.put_json(JobManager.status_key(self.league_id), self.status())
+
+    def status(self):
+        """Json serialisable job progress"""
+        return {
+            'league_id': self.league_id,
+            'state': self.state,
+            'done': self.done,
+            'total': self.total,
+            'progress': (self.done / self.total * 100) if self.total else 100.0,
+            'error': self.error,
+            'store_path': self.store.path,
+            'elapsed': (self.finished_at or time.time()) - self.started_at,
+            'request_key': self.request_key,
+            'owner': self.owner,
+            'updated': self.published_at,
+            # Versions restart with each job, so they are qualified by its start time
+            'aggregates_version': (None if self.aggregates_version is None
+                                   else f'{self.started_at:.3f}-{self.aggregates_version}'),
+        }
+
+
+class RemoteJob:
+    """Read only view of a job running in another worker, via its progress in the state backend"""
+
+    def __init__(self, league_id, backend, store_path):
+        self.league_id = league_id
+        self.backend = backend
+        self.store_path = store_path
+        self._status = None
+
+    def status(self):
+        status = self.backend.get_json(JobManager.status_key(self.league_id))
+        if status is None:
+            # Claimed by another worker that has not published yet
+            status = {'league_id': self.league_id, 'state': QUEUED, 'done': 0, 'total': 0, 'progress': 0.0,
+                      'error': None, 'store_path': self.store_path, 'elapsed': 0.0, 'updated': time.time()}
+        elif status['state'] in (QUEUED, RUNNING) and time.time() - status['updated'] > JOB_LEASE_TTL:
+            status = {**status, 'state': FAILED, 'error': "Worker stopped reporting progress"}
+        self._status = status
+        return status
+
+    @property
+    def state(self):
+        return (self._status or self.status())['state']
+
+    @property
+    def active(self):
+        return self.state in (QUEUED, RUNNING)
+
+
+class JobManager:
+    """
+    Runs ingest jobs on a server side worker pool, one job per league across every worker sharing the state
+    backend. Requests for a league that is already loading, or already loaded with the same managers and
+    gameweeks, share the existing job, which may be running in another worker.
+    """
+
+    def __init__(self, root='leagues', max_workers=JOB_WORKERS, backend=None, bootstrap=None, history=None):
+        self.root = root
+        self.backend = backend or state_backend
+        self.bootstrap = bootstrap or bootstrap_store
+        self.history = history or history_store
+        self.owner = f'{socket.gethostname()}:{os.getpid()}'
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='ingest')
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def status_key(league_id):
+        return f'jobs/{league_id}/status.json'
+
+    @staticmethod
+    def lease_key(league_id):
+        return f'jobs/{league_id}/lease.json'
+
+    @staticmethod
+    def aggregates_key(league_id):
+        return f'jobs/{league_id}/aggregates.npz'
+
+    def store_path(self, league_id):
+        return f'{self.root}/{league_id}/manager_store'
+
+    def tables_path(self, league_id):
+        return f'{self.root}/{league_id}/aggregates'
+
+    def submit(self, league_id, manager_list, gw_list):
+        """Start loading a league, or return the job already covering it. Reloads only fetch what is missing."""
+        return self._submit(league_id, manager_list, gw_list, _request_key(manager_list, gw_list))
+
+    def stream(self, league_id, gw_list):
+        """
+        Start loading a league while its standings are still being paged, queueing managers page by page.
+        A later submit() with the full manager list shares this job.
+        """
+        return self._submit(league_id, None, gw_list, None)
+
+    def _submit(self, league_id, manager_list, gw_list, request_key):
+        with self._lock:
+            job = self.get(league_id)
+            status = job.status() if job is not None else None
+            if status is not None and (job.active or (
+                    status['state'] == COMPLETE and request_key in (None, status.get('request_key'))
+                    and time.time() - status['updated'] < REFRESH_AFTER)):
+                return job
+            if not self.backend.claim(self.lease_key(league_id), self.owner, JOB_LEASE_TTL):
+                return RemoteJob(league_id, self.backend, self.store_path(league_id))
+            snapshot = self.bootstrap.get()
+            self.history.add_bootstrap(snapshot.gameweeks.season, snapshot)
+            job = IngestJob(league_id, manager_list, gw_list, self.store_path(league_id),
+                            self.tables_path(league_id), self.backend, self.owner, snapshot.gameweeks, self.history)
+            self._jobs[league_id] = job
+            job.start(self._executor, pages=iter_league_pages(league_id) if manager_list is None else None)
+            return job
+
+    def get(self, league_id):
+        """The league's job, local if this worker ran it most recently, None if it was never loaded"""
+        job = self._jobs.get(league_id)
+        if job is not None and not job.active:
+            status = self.backend.get_json(self.status_key(league_id))
+            if status is not None and status.get('owner') != self.owner:
+                job = None
+        if job is None and self.backend.get(self.status_key(league_id)) is not None:
+            job = RemoteJob(league_id, self.backend, self.store_path(league_id))
+        return job
+
+    def aggregates(self, league_id):
+        """Last published AggregateSnapshot of the league's loading job, None if there is none"""
+        value = self.backend.get(self.aggregates_key(league_id))
+        return None if value is None else AggregateSnapshot.from_bytes(value)
+
+
+job_manager = JobManager()
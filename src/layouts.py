@@ -7,13 +7,33 @@ import dash_table
 import dash_core_components as dcc
 from dash.dash import no_update
 
-import pandas as pd
+import json
+import logging
+from functools import lru_cache
+from concurrent.futures import ThreadPoolExecutor
+
+from plotly.utils import PlotlyJSONEncoder
 from requests import HTTPError
 
 from app import app
-from fpl_api_utils import league_dataframe, get_played_gameweeks
+from bootstrap_store import bootstrap_store
+from manager_store import ManagerStore
+from aggregate_store import AggregateStore
+from fpl_api_utils import league_dataframe
 from loading_loop import progress
-from plots import create_graphs
+from jobs import job_manager
+from metrics import timed, timed_callback
+from plots import (create_season_graphs, create_gameweek_graphs, create_aggregate_graphs, SEASON_FIGURES,
+                   GAMEWEEK_FIGURES, STREAM_FIGURES)
+from session_store import session_store
+
+# Figures kept in memory, each keyed on the data version, its stage's inputs and the figure id
+FIGURE_CACHE_SIZE = 128
+# Build the other tabs of the visible stage in the background after serving the active one
+PREFETCH_TABS = True
+
+logger = logging.getLogger(__name__)
+_prefetch_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='prefetch')
 
 about_tab = dbc.Card(
     dbc.CardBody(
@@ -88,7 +108,7 @@ league_table = html.Div(
             dbc.Col(
                 dbc.Collapse(
                     dbc.Card(
-                        dash_table.DataTable(id='league-table', style_as_list_view=True,
+                        dash_table.DataTable(id='league-table', style_as_list_view=True, page_size=50,
                                              style_cell={'textAlign': 'left', 'color': 'black'},)
                     ),
                     id="collapse",
@@ -167,7 +187,6 @@ control_tabs = dbc.Tabs(
 
 analysis = html.Div(
     [
-        dcc.Store(id="fig_store"),
         league_table,
         dbc.Row(
             dbc.Col(
@@ -193,6 +212,7 @@ analysis = html.Div(
     [Input("collapse-button", "n_clicks")],
     [State("collapse", "is_open")],
 )
+@timed_callback
 def toggle_collapse(n, is_open):
     if n:
         return not is_open
@@ -206,6 +226,7 @@ def toggle_collapse(n, is_open):
      Output("league-id", "valid"), Output("league-id", "invalid")],
     [Input("run-button", "n_clicks"), State("league-id", "value")]
 )
+@timed_callback
 def run(n_clicks, l_id):
     """
     Main entry callback. Triggered when user inputs league id and clicks run.
@@ -215,62 +236,149 @@ def run(n_clicks, l_id):
     """
     if l_id is None:
         raise PreventUpdate
+    gw_list = bootstrap_store.get().gameweeks.played(including_active=True)
+    # Managers are ingested page by page while the standings table is still loading
+    job_manager.stream(l_id, gw_list)
     try:
-        league_df, name = league_dataframe(l_id, manager_limit=100)
+        league_df, name = league_dataframe(l_id)
     except HTTPError:
         return no_update, no_update, no_update, no_update, no_update, no_update, False, True
 
     columns = [{"name": i, "id": i} for i in league_df.columns]
     manager_list = [x for x in zip(league_df['entry'].to_list(), league_df['entry_name'].to_list())]
-    gw_list = get_played_gameweeks(including_active=True)
 
     return league_df.to_dict('records'), columns, manager_list, {'display': 'block'}, gw_list, name, True, False
 
 
+@lru_cache(maxsize=2)
+def _load_manager_df(df_path, data_version):
+    """Manager store contents, reread only when the store version changes"""
+    return ManagerStore(df_path).read()
+
+
+@lru_cache(maxsize=4)
+def _season_df(df_path, data_version, gw_range):
+    stored_df = _load_manager_df(df_path, data_version)
+    return stored_df[(stored_df['gw'] >= gw_range[0]) & (stored_df['gw'] <= gw_range[1])]
+
+
+def _payload_size(fig):
+    """Bytes of json sent to the browser for fig"""
+    with timed('serialize'):
+        return len(json.dumps(fig, cls=PlotlyJSONEncoder))
+
+
+@lru_cache(maxsize=FIGURE_CACHE_SIZE)
+def _season_figure(df_path, data_version, gw_range, fig_id):
+    fig = create_season_graphs(_season_df(df_path, data_version, gw_range), figures=(fig_id,))[fig_id]
+    return fig, _payload_size(fig)
+
+
+@lru_cache(maxsize=2)
+def _stream_aggregates(league_id, stream_version):
+    """Running aggregates of a loading league, refetched only when the job publishes a new version"""
+    return job_manager.aggregates(league_id)
+
+
+def _stream_figure(league_id, stream_version, gw, gw_range, fig_id):
+    """Figure fig_id drawn from a loading league's running aggregates"""
+    aggregates = _stream_aggregates(league_id, stream_version)
+    if aggregates is None or not aggregates.n_managers:
+        return "Loading"
+    fig = create_aggregate_graphs(aggregates, bootstrap_store.get().elements, gw, gw_range,
+                                  figures=(fig_id,))[fig_id]
+    logger.info("Streamed figure %s from %d managers", fig_id, aggregates.n_managers)
+    return dcc.Graph(figure=fig)
+
+
+@lru_cache(maxsize=FIGURE_CACHE_SIZE)
+def _gameweek_figure(df_path, data_version, bootstrap_version, gw, fig_id):
+    fig = create_gameweek_graphs(_load_manager_df(df_path, data_version), bootstrap_store.get().elements, gw,
+                                 figures=(fig_id,))[fig_id]
+    return fig, _payload_size(fig)
+
+
+@lru_cache(maxsize=4)
+def _league_tables(tables_path, data_version, squad_gw=None):
+    """Materialised aggregate tables of a league, with squads for squad_gw if given"""
+    return AggregateStore(tables_path).read(squad_gws=() if squad_gw is None else (squad_gw,))
+
+
+@lru_cache(maxsize=FIGURE_CACHE_SIZE)
+def _table_season_figure(tables_path, data_version, gw_range, fig_id):
+    fig = create_aggregate_graphs(_league_tables(tables_path, data_version), None, None, gw_range,
+                                  figures=(fig_id,))[fig_id]
+    return fig, _payload_size(fig)
+
+
+@lru_cache(maxsize=FIGURE_CACHE_SIZE)
+def _table_gameweek_figure(tables_path, data_version, bootstrap_version, gw, fig_id):
+    tables = _league_tables(tables_path, data_version, gw if fig_id == 'man-corr' else None)
+    fig = create_aggregate_graphs(tables, bootstrap_store.get().elements, gw, figures=(fig_id,))[fig_id]
+    return fig, _payload_size(fig)
+
+
+def _render_figure(build_figure, stage_args, fig_id, stage_figures):
+    """Build (or fetch from cache) the visible figure, then optionally warm the cache for the rest of its stage"""
+    fig, payload = build_figure(*stage_args, fig_id)
+    logger.info("Rendered figure %s, payload %.1f kB", fig_id, payload / 1024)
+    if PREFETCH_TABS:
+        for other_id in stage_figures:
+            if other_id != fig_id:
+                _prefetch_executor.submit(build_figure, *stage_args, other_id)
+    return dcc.Graph(figure=fig)
+
+
 @app.callback(
     [Output("season-tab-content", "children"), Output("gameweek-tab-content", "children")],
     [Input("season-tabs", "active_tab"), Input("gameweek-tabs", "active_tab"),
-     Input("master-tabs", "active_tab"), Input("fig_store", "data")],
+     Input("master-tabs", "active_tab"), Input("load-complete", "children"),
+     Input("gw-select", "value"), Input("gw-slider", "value"), Input("stream-version", "data"),
+     State("manager-df-path", "data"), State("session_id", "children"), State("job-id", "data")],
 )
-def render_tab_content(active_season_tab, active_gw_tab, master_tab, data):
+@timed_callback
+def render_tab_content(active_season_tab, active_gw_tab, master_tab, loaded, gw, gw_slider, stream_version,
+                       df_path, session_id, job_id):
     """
     This callback takes the 'active_tab' property as input, as well as the
-    stored graphs, and renders the tab content depending on what the value of
-    'active_tab' is.
+    figure inputs, and renders the tab content depending on what the value of
+    'active_tab' is. Only the visible figure is built and sent to the browser. Figures are memoized on the
+    manager store version and their stage's inputs, so season figures ignore the gameweek selection.
+    Figures are drawn from the league's materialised aggregate tables when they cover the stored data, and from
+    the manager rows otherwise. While the league is loading, the streamed figures are redrawn from the job's
+    running aggregates each time it publishes a new version.
     """
-    if data is None:
+    session_store.touch(session_id)
+    if not loaded and stream_version is not None and job_id is not None and gw is not None:
+        if (master_tab == "gws") and (active_gw_tab in STREAM_FIGURES):
+            return "Unrendered", _stream_figure(job_id, stream_version, int(gw), None, active_gw_tab)
+        elif (master_tab == "season") and (active_season_tab in STREAM_FIGURES):
+            gw_range = (min(gw_slider), max(gw_slider))
+            return _stream_figure(job_id, stream_version, None, gw_range, active_season_tab), "Unrendered"
+        return "Loading", "Loading"
+    if not loaded or df_path is None or gw is None:
         return "Data Not Generated", "Data Not Generated"
 
-    if (master_tab == "gws") and (active_gw_tab in data):
-        return "Unrendered", dcc.Graph(figure=data[active_gw_tab])
-    elif (master_tab == "season") and (active_season_tab in data):
-        return dcc.Graph(figure=data[active_season_tab]), "Unrendered"
+    data_version = ManagerStore(df_path).version()
+    tables_path = job_manager.tables_path(job_id)
+    materialised = job_id is not None and AggregateStore(tables_path).data_version() == data_version
+    if (master_tab == "gws") and (active_gw_tab in GAMEWEEK_FIGURES):
+        build_figure, source = (_table_gameweek_figure, tables_path) if materialised else (_gameweek_figure, df_path)
+        stage_args = (source, data_version, bootstrap_store.get().version, int(gw))
+        return "Unrendered", _render_figure(build_figure, stage_args, active_gw_tab, GAMEWEEK_FIGURES)
+    elif (master_tab == "season") and (active_season_tab in SEASON_FIGURES):
+        build_figure, source = (_table_season_figure, tables_path) if materialised else (_season_figure, df_path)
+        stage_args = (source, data_version, (min(gw_slider), max(gw_slider)))
+        return _render_figure(build_figure, stage_args, active_season_tab, SEASON_FIGURES), "Unrendered"
     else:
         return "Graph Not Generated", "Graph Not Generated"
 
 
-@app.callback(
-    Output("fig_store", "data"),
-    [Input("load-complete", "children"),
-     Input("gw-select", "value"),
-     Input("gw-slider", "value"),
-     State("fpl-data-paths", "data"),
-     State("manager-df-path", "data")]
-)
-def create_figures(loaded, gw, gw_slider, data_paths, df_path):
-    if loaded:
-        stored_df = pd.read_feather(df_path)
-        stored_df = stored_df[(stored_df['gw']>=min(gw_slider)) & (stored_df['gw']<=max(gw_slider))]
-        players_df = pd.read_feather(data_paths['players'])
-        return create_graphs(stored_df, players_df, int(gw))
-    else:
-        raise PreventUpdate
-
-
 @app.callback(
     [Output("gw-select", "options"), Output("gw-select", "value")],
     [Input("gw-slider", "value"), State("gw-select", "value")],
 )
+@timed_callback
 def populate_gw_select(slider_vals, current_val):
     if isinstance(slider_vals, list):
         options = [{'label': f'Gameweek {x}', 'value': str(x)} for x in range(slider_vals[0], slider_vals[1]+1)]
@@ -290,6 +398,7 @@ def populate_gw_select(slider_vals, current_val):
     [Output("gw-slider", "max"), Output("gw-slider", "value"), Output("gw-slider", "marks")],
     [Input("gw-list", "data")]
 )
+@timed_callback
 def populate_gw_slider(gw_list):
     if isinstance(gw_list, list):
         return max(gw_list), [1, max(gw_list)], {x: {'label': f'GW{x}', 'style': {'color': '#ffffff'}} for x in gw_list}
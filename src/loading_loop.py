@@ -4,114 +4,78 @@ import dash_core_components as dcc
 from dash.dependencies import Input, Output, State
 from dash.exceptions import PreventUpdate
 from dash import callback_context
+from dash.dash import no_update
+from flask import jsonify, abort
 
-import pandas as pd
-
-from app import app, DATA_STORE
-from fpl_api_utils import scrape_manager_team
+from app import app, server
+from jobs import job_manager, COMPLETE, FAILED
+from metrics import timed_callback
+from session_store import session_store
 
 progress = html.Div(
     [
         dcc.Interval(id="progress-interval", interval=0.5*1000, disabled=True),
-        html.Div(id="latest-processed-index", style={'display': 'none'}),
-        html.Div(id="progress-output", style={'display': 'none'}),
-        html.Div(0, id="run-index", style={'display': 'none'}),
+        dcc.Store(id="job-id"),
+        dcc.Store(id="stream-version"),
         html.Div(id="load-complete", style={'display': 'none'}),
         dbc.Progress(id="progress", striped=True, className='mb-3'),
     ]
 )
 
 
-@app.callback(
-    Output("run-index", "children"),
-    [Input("progress-interval", "n_intervals"), Input("manager-list", "data"),
-     State("latest-processed-index", "children"), State("run-index", "children")]
-)
-def iterate_index(interval_trigger, list_input, latest_processed_index, run_index):
-    """
-    Callback to iterate through the list indices. Steps to next index when latest_processed_index from loop_contents is
-    equal to the current run index. Triggered regularly by interval component to check if loop contents has completed
-    and ready to receive next run_index.
-    :param interval_trigger: interval component triggering the callback at regular intervals.
-    :param list_input: used to trigger when user submits new manager list. Resets run_index to zero
-    :param latest_processed_index: most recent list index loop contents has successfull processed
-    :param run_index: current run index
-    :return:
-    """
-    ctx = callback_context
-    if ctx.triggered[0]['prop_id'] == "manager-list.data":
-        return 0
-    elif run_index != latest_processed_index:
-        raise PreventUpdate
-    else:
-        return run_index+1
+@server.route('/jobs/<int:league_id>')
+def job_status(league_id):
+    """Polling endpoint for the progress of a league ingest job"""
+    job = job_manager.get(league_id)
+    if job is None:
+        abort(404)
+    return jsonify(job.status())
 
 
 @app.callback(
-    [Output("progress", "value"), Output("latest-processed-index", "children"),
-     Output("manager-df-path", "data"), Output("progress", "children")],
-    [Input("run-index", "children"), State("manager-list", "data"), State("gw-list", "data"),
-     State("session_id", "children"), State("manager-df-path", "data")]
+    [Output("job-id", "data"), Output("manager-df-path", "data"),
+     Output("progress", "value"), Output("progress", "children"),
+     Output("progress-interval", "disabled"), Output("load-complete", "children"),
+     Output("stream-version", "data")],
+    [Input("manager-list", "data"), Input("progress-interval", "n_intervals"),
+     State("league-id", "value"), State("gw-list", "data"), State("job-id", "data"), State("session_id", "children"),
+     State("stream-version", "data")]
 )
-def loop_contents(run_index, list_input, gw_list, session_id, df_path):
+@timed_callback
+def track_job(list_input, interval_trigger, league_id, gw_list, job_id, session_id, stream_version):
     """
-    Main processing contents of loop.
-    Given an index 'run_index' to the list 'list_input', extracts from list and processes.
-    Scrapes manager team and saves to feather.
-    Updates progress bar.
-    :param run_index:
-    :param list_input:
-    :param gw_list:
-    :param session_id:
-    :param df_path:
-    :return:
-    """
-    if list_input is None:
-        raise PreventUpdate
-    elif run_index >= len(list_input):
-        raise PreventUpdate
-
-    entry_id, entry_name = list_input[run_index]
-
-    manager_df = scrape_manager_team(entry_id, gw_list)
-    manager_df['manager'] = entry_id
-    manager_df['team_name'] = entry_name
-
-    if df_path is not None:
-        stored_df = pd.read_feather(df_path)
-        manager_df = pd.concat([stored_df, manager_df]).reset_index(drop=True)
-        manager_df = manager_df.drop_duplicates()
-    else:
-        df_path = DATA_STORE.joinpath(session_id, 'manager_df.feather')
-
-    manager_df.to_feather(df_path)
-    progress_val = ((run_index+1)/len(list_input))*100
-    progress_str = f"{run_index+1}/{len(list_input)}" if progress_val >= 5 else ""
-    latest_processed_index = run_index
-    return progress_val, latest_processed_index, str(df_path), progress_str
-
-
-@app.callback(
-    [Output("progress-interval", "disabled"), Output("load-complete", "children")],
-    [Input("manager-list", "data"), Input("progress", "value")]
-)
-def start_stop_interval(list_input, progress):
-    """
-    Callback to start/stop the interval component which controls the run_index iteration.
-    :param list_input: manager list
-    :param progress: progress bar value
+    Submits the league to the server side job manager when a new manager list arrives, then polls the job on each
+    interval tick to update the progress bar. The interval is stopped once the job completes or fails.
+    The stream version only changes when the job publishes new running aggregates, so streamed figures are
+    redrawn at the job's stream interval rather than on every tick.
+    :param list_input: manager list, triggers a new job
+    :param interval_trigger: interval component triggering the callback at regular intervals.
+    :param league_id: league id input in input field
+    :param gw_list: gameweeks to load
+    :param job_id: league id of the job being tracked
+    :param session_id: session id, its last access is refreshed in the session store
+    :param stream_version: aggregates version the session's streamed figures were drawn from
     :return:
     """
+    session_store.touch(session_id)
     ctx = callback_context
     if ctx.triggered[0]['prop_id'] == "manager-list.data":
-        return False, False
-
-    if list_input is None:
-        raise PreventUpdate
+        if list_input is None:
+            raise PreventUpdate
+        job = job_manager.submit(league_id, list_input, gw_list)
+    else:
+        job = job_manager.get(job_id)
+        if job is None:
+            raise PreventUpdate
 
-    if progress >= 100:
-        return True, True
-    elif progress < 100:
-        return False, False
+    status = job.status()
+    complete = status['state'] == COMPLETE
+    if status['state'] == FAILED:
+        progress_str = "Failed"
     else:
-        raise PreventUpdate
\ No newline at end of file
+        progress_str = f"{status['done']}/{status['total']}" if status['progress'] >= 5 else ""
+    aggregates_version = status.get('aggregates_version')
+    if complete or aggregates_version == stream_version:
+        aggregates_version = no_update
+    return (job.league_id, status['store_path'], status['progress'], progress_str,
+            not job.active, complete, aggregates_version)
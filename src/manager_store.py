@@ -0,0 +1,120 @@
+import io
+import json
+import threading
+
+import pandas as pd
+
+from metrics import timed
+from schema import enforce_manager_schema
+from state_backend import state_backend
+
+MANIFEST = 'manifest.jsonl'
+
+_locks = {}
+_locks_lock = threading.Lock()
+
+
+def _store_lock(path):
+    with _locks_lock:
+        return _locks.setdefault(str(path), threading.Lock())
+
+
+class ManagerStore:
+    """
+    Append only store of scraped manager rows, kept in the state backend under the key prefix path.
+    Each manager is written to its own feather partition and recorded in a line of an append only manifest,
+    so adding a manager costs the same however many are already stored. Readers see one table.
+    """
+
+    def __init__(self, path, backend=None):
+        self.path = str(path).rstrip('/')
+        self.backend = backend or state_backend
+        self._lock = _store_lock(f'{id(self.backend)}:{self.path}')
+
+    @property
+    def manifest_key(self):
+        return f'{self.path}/{MANIFEST}'
+
+    def _partition_key(self, name):
+        return f'{self.path}/{name}'
+
+    @staticmethod
+    def _partition_name(manager_id):
+        return f'manager_{manager_id}.feather'
+
+    def _read_partition(self, name, columns=None):
+        value = self.backend.get(self._partition_key(name))
+        return None if value is None else pd.read_feather(io.BytesIO(value), columns=columns)
+
+    def append(self, manager_df, manager_id):
+        """Write manager_df as the partition for manager_id, replacing any earlier partition for that manager"""
+        name = self._partition_name(manager_id)
+        buffer = io.BytesIO()
+        with timed('manager_store', op='write'):
+            manager_df.reset_index(drop=True).to_feather(buffer)
+        record = {'manager': int(manager_id), 'file': name, 'rows': len(manager_df),
+                  'gws': sorted(int(gw) for gw in manager_df['gw'].unique()) if 'gw' in manager_df else [],
+                  'team_name': manager_df['team_name'].iloc[0] if len(manager_df) else None}
+        with self._lock:
+            self.backend.put(self._partition_key(name), buffer.getvalue())
+            self._write_record(record)
+
+    def merge(self, manager_df, manager_id, team_name):
+        """
+        Add gameweek rows for manager_id to its partition, replacing rows for the same gameweeks,
+        and set team_name on every row. Costs one read and write of that manager's partition only.
+        :return: the manager's merged partition
+        """
+        with timed('manager_store', op='read_partition'):
+            stored_df = self._read_partition(self._partition_name(manager_id))
+        if stored_df is not None:
+            stored_df = stored_df[~stored_df['gw'].isin(manager_df['gw'])] if 'gw' in manager_df else stored_df
+            manager_df = pd.concat([stored_df, manager_df], ignore_index=True).sort_values('gw')
+        manager_df = enforce_manager_schema(manager_df.assign(manager=manager_id, team_name=team_name))
+        self.append(manager_df, manager_id)
+        return manager_df
+
+    def remove(self, manager_id):
+        """Drop manager_id from the dataset"""
+        with self._lock:
+            self.backend.delete(self._partition_key(self._partition_name(manager_id)))
+            self._write_record({'manager': int(manager_id), 'file': None})
+
+    def _write_record(self, record):
+        self.backend.append(self.manifest_key, json.dumps(record))
+
+    def manifest(self):
+        """Latest manifest record for each stored manager, in insertion order"""
+        records = {}
+        for line in self.backend.lines(self.manifest_key):
+            record = json.loads(line)
+            records.pop(record['manager'], None)
+            if record['file'] is not None:
+                records[record['manager']] = record
+        return records
+
+    def stored_gameweeks(self):
+        """Manager id -> (team name, set of stored gameweeks)"""
+        return {manager: (record.get('team_name'), set(record.get('gws', [])))
+                for manager, record in self.manifest().items()}
+
+    def managers(self):
+        return list(self.manifest())
+
+    def version(self):
+        """Changes whenever a partition is appended or the store is cleared"""
+        return self.backend.version(self.manifest_key)
+
+    def read(self, columns=None):
+        """Read every partition as a single DataFrame"""
+        with timed('manager_store', op='read'):
+            frames = [self._read_partition(record['file'], columns) for record in self.manifest().values()]
+            frames = [frame for frame in frames if frame is not None]
+            if not frames:
+                return pd.DataFrame(columns=columns)
+            # Categories differ between partitions, so they are restored after concatenating
+            return enforce_manager_schema(pd.concat(frames, ignore_index=True), columns)
+
+    def clear(self):
+        with self._lock:
+            self.backend.delete_prefix(self.path + '/')
@@ -0,0 +1,176 @@
+import time
+import cProfile
+import threading
+import functools
+from contextlib import contextmanager
+
+from flask import request, Response, jsonify
+
+# Histogram bucket upper bounds in seconds
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+def _label_str(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{key}="{value}"' for key, value in sorted(labels.items())) + '}'
+
+
+class Histogram:
+    """Cumulative bucket histogram per label set, rendered in the Prometheus text format"""
+
+    def __init__(self, name, help_text, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.buckets = buckets
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            counts, total = self._series.get(key, ([0] * (len(self.buckets) + 1), 0.0))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+            counts[-1] += 1
+            self._series[key] = (counts, total + value)
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            for key, (counts, total) in sorted(self._series.items()):
+                labels = dict(key)
+                for bound, count in zip(self.buckets, counts):
+                    lines.append(f'{self.name}_bucket{_label_str({**labels, "le": bound})} {count}')
+                lines.append(f'{self.name}_bucket{_label_str({**labels, "le": "+Inf"})} {counts[-1]}')
+                lines.append(f'{self.name}_sum{_label_str(labels)} {total}')
+                lines.append(f'{self.name}_count{_label_str(labels)} {counts[-1]}')
+        return lines
+
+
+class Counter:
+    """Monotonic counter per label set"""
+
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help = help_text
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._series[key] = self._series.get(key, 0) + amount
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} counter']
+        with self._lock:
+            for key, value in sorted(self._series.items()):
+                lines.append(f'{self.name}{_label_str(dict(key))} {value}')
+        return lines
+
+
+class Registry:
+    """Metrics exposed on /metrics. Gauges are callables returning {name: value}, read at scrape time."""
+
+    def __init__(self):
+        self._metrics = {}
+        self._gauges = []
+
+    def histogram(self, name, help_text, buckets=DEFAULT_BUCKETS):
+        return self._metrics.setdefault(name, Histogram(name, help_text, buckets))
+
+    def counter(self, name, help_text):
+        return self._metrics.setdefault(name, Counter(name, help_text))
+
+    def register_gauges(self, prefix, func):
+        self._gauges.append((prefix, func))
+
+    def render(self):
+        lines = []
+        for metric in self._metrics.values():
+            lines += metric.render()
+        for prefix, func in self._gauges:
+            for name, value in func().items():
+                lines += [f'# TYPE {prefix}_{name} gauge', f'{prefix}_{name} {value}']
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+callback_seconds = registry.histogram('dash_callback_seconds', 'Dash callback duration')
+stage_seconds = registry.histogram('stage_seconds', 'Duration of instrumented processing stages')
+http_request_seconds = registry.histogram('fpl_http_request_seconds', 'FPL api request attempt duration')
+http_requests = registry.counter('fpl_http_requests_total', 'FPL api request attempts by endpoint and status')
+http_retries = registry.counter('fpl_http_retries_total', 'FPL api request retries by endpoint')
+
+
+@contextmanager
+def timed(stage, **labels):
+    """Record the duration of the with block in stage_seconds"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        stage_seconds.observe(time.perf_counter() - start, stage=stage, **labels)
+
+
+def timed_callback(func):
+    """Record every call of a Dash callback in dash_callback_seconds. Apply below @app.callback."""
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            callback_seconds.observe(time.perf_counter() - start, callback=func.__name__)
+    return wrapper
+
+
+_profile = {'armed': False, 'path': None, 'last': None}
+_profile_lock = threading.Lock()
+
+
+def install(server, profile_dir):
+    """
+    Expose /metrics on the flask server, and cProfile support: add ?profile=1 to any request, or GET /profile/next
+    to profile the next dash callback request. Profiles are dumped to profile_dir, /profile/last gives the latest.
+    """
+    @server.route('/metrics')
+    def metrics():
+        return Response(registry.render(), mimetype='text/plain; version=0.0.4')
+
+    @server.route('/profile/next')
+    def profile_next():
+        with _profile_lock:
+            _profile['armed'] = True
+            _profile['path'] = request.args.get('path', '/_dash-update-component')
+        return jsonify({'armed': True, 'path': _profile['path']})
+
+    @server.route('/profile/last')
+    def profile_last():
+        return jsonify({'file': _profile['last']})
+
+    @server.before_request
+    def start_profile():
+        profile = request.args.get('profile') == '1'
+        with _profile_lock:
+            if _profile['armed'] and request.path == _profile['path']:
+                _profile['armed'] = False
+                profile = True
+        if profile:
+            request.environ['fpl.profiler'] = cProfile.Profile()
+            request.environ['fpl.profiler'].enable()
+
+    @server.after_request
+    def dump_profile(response):
+        profiler = request.environ.pop('fpl.profiler', None)
+        if profiler is not None:
+            profiler.disable()
+            profile_dir.mkdir(parents=True, exist_ok=True)
+            name = request.path.strip('/').replace('/', '_') or 'index'
+            path = profile_dir.joinpath(f'{time.strftime("%Y%m%d-%H%M%S")}-{name}.prof')
+            profiler.dump_stats(str(path))
+            _profile['last'] = str(path)
+        return response
@@ -1,50 +1,111 @@
+import numpy as np
+import pandas as pd
 import plotly.express as px
 import plotly.graph_objects as go
 
 from analysis import create_ranking_df, ownership, index_by_element, create_corr_matrices
+from dimensions import ManagerIndex
+from metrics import timed
 
+# Leagues with more managers than this are plotted as aggregate views: the top ranked managers drawn individually,
+# the rest summarised by percentile bands, and correlation computed over the top ranked managers only
+LARGE_LEAGUE_MANAGERS = 100
+TOP_K_MANAGERS = 20
+CORR_SAMPLE_MANAGERS = 100
+BAND_QUANTILES = (0.1, 0.5, 0.9)
+# Above this many managers in one plot, lines are drawn with WebGL
+WEBGL_MANAGERS = 50
 
-def league_ranking(running_rank):
+
+def _compact(values):
+    """Integral float arrays as ints, with None for NaN, so they serialise without a trailing .0"""
+    missing = np.isnan(values)
+    present = values[~missing]
+    if not np.array_equal(present, np.round(present)):
+        return values
+    compact = np.where(missing, 0, values).astype(np.int64)
+    if missing.any():
+        compact = compact.astype(object)
+        compact[missing] = None
+    return compact
+
+
+def _manager_traces(ts_df, single_trace=False):
+    """
+    Line traces for every row of ts_df (managers x gameweeks), built from the underlying arrays.
+    Above WEBGL_MANAGERS rows the traces use WebGL. With single_trace all managers are drawn as one trace,
+    rows separated by NaN gaps, with the team name carried as hover data.
+    :param ts_df: timeseries df indexed by team name
+    :param single_trace: draw every manager in a single trace
+    :return: list of traces
+    """
+    scatter = go.Scattergl if len(ts_df) > WEBGL_MANAGERS else go.Scatter
+    x = ts_df.columns.to_numpy(dtype=float)
+    values = ts_df.to_numpy(dtype=float)
+    names = ts_df.index.astype(str).to_numpy()
+    if single_trace:
+        n_rows, n_cols = values.shape
+        gap = np.full((n_rows, 1), np.nan)
+        return [scatter(x=_compact(np.tile(np.append(x, np.nan), n_rows)),
+                        y=_compact(np.hstack([values, gap]).ravel()),
+                        customdata=np.repeat(names, n_cols + 1),
+                        hovertemplate='%{customdata}<br>GameWeek %{x}: %{y}<extra></extra>',
+                        mode='lines', name='Managers')]
+    x, values = _compact(x), _compact(values)
+    return [scatter(x=x, y=row, mode='lines+markers', name=name) for name, row in zip(names, values)]
+
+
+def league_ranking(running_rank, top_k=None, single_trace=False):
     """
     Plot to show manager overall rankings over time.
     :param running_rank: df
+    :param top_k: only plot the top_k ranked managers
+    :param single_trace: draw every manager in one NaN separated trace
     :return: plotly fig
     """
     running_rank = running_rank.sort_values(by=running_rank.columns[-1], ascending=True)
+    if top_k:
+        running_rank = running_rank.head(top_k)
     # League rank plot
-    fig = go.Figure()
-    for row in running_rank.iterrows():
-        fig.add_trace(go.Scatter(x=row[1].index.to_list(), y=row[1].astype(int).to_list(),
-                                 mode='lines+markers',
-                                 name=row[0]))
+    fig = go.Figure(data=_manager_traces(running_rank, single_trace))
     fig.update_layout(xaxis_title='GameWeek', yaxis_title='League Rank', yaxis_autorange="reversed",
                       yaxis_dtick=1, xaxis_dtick=1)
     return fig
 
 
-def league_ts_plot(ts_df, title):
+def league_ts_plot(ts_df, title, top_k=None, single_trace=False):
     """
     Plot to show manager overall points over time.
     :param ts_df: timeseries df containing a variable measured every gameweek for all managers.
+    :param top_k: only plot the top_k managers by latest value, with percentile bands for the whole league
+    :param single_trace: draw every manager in one NaN separated trace
     :return: plotly fig
     """
     total_points = ts_df.sort_values(by=ts_df.columns[-1], ascending=True)
+    if top_k:
+        total_points = total_points.tail(top_k)
     # League rank plot
-    fig = go.Figure()
-    for row in total_points.iterrows():
-        fig.add_trace(go.Scatter(x=row[1].index.to_list(), y=row[1].astype(int).to_list(),
-                                 mode='lines+markers',
-                                 name=row[0]))
+    traces = []
+    if top_k:
+        for q, band in ts_df.quantile(list(BAND_QUANTILES)).iterrows():
+            traces.append(go.Scatter(x=band.index.to_numpy(), y=band.to_numpy(), mode='lines',
+                                     line=dict(dash='dash', color='grey'),
+                                     name=f'League {int(q * 100)}th percentile'))
+    fig = go.Figure(data=traces + _manager_traces(total_points, single_trace))
     fig.update_layout(xaxis_title='GameWeek', yaxis_title=title)
     return fig
 
 
-def manager_box_plot(manager_df):
+def manager_box_plot(manager_df, top_k=None):
     """
     Plot to show manager points box plots.
     :param manager_df: df
+    :param top_k: only plot the top_k managers by latest total points
     :return: plotly fig
     """
+    if top_k:
+        latest = manager_df[manager_df['gw'] == manager_df['gw'].max()]
+        manager_df = manager_df[manager_df['manager'].isin(latest.nlargest(top_k, 'total_points')['manager'])]
     fig = px.box(manager_df[['team_name', 'points']], x="points", y="team_name",
                  orientation='h')
     fig.update_yaxes(type='category')
@@ -120,38 +181,152 @@ def captaincy_plot(captains_df):
     return fig
 
 
-def create_graphs(manager_df, players_df, gw):
+SEASON_FIGURES = ('rank', 'total_points', 'team-value', 'points-box')
+GAMEWEEK_FIGURES = ('prc-own', 'trans-in', 'trans-out', 'captains', 'man-corr')
+AGGREGATE_FIGURES = SEASON_FIGURES + GAMEWEEK_FIGURES
+# Figures drawn from running aggregates while a league is loading
+STREAM_FIGURES = ('rank', 'prc-own', 'captains')
+
+
+def create_season_graphs(manager_df, figures=SEASON_FIGURES):
+    """
+    Create the season overview figures, which do not depend on the selected gameweek
+    :param manager_df: Manager dataframe, filtered to the gameweek range of interest
+    :param figures: ids of the figures to build, only the analysis they need is run
+    :return: dict
+    """
+    manager_index = ManagerIndex(manager_df)
+    large_league = manager_df['manager'].nunique() > LARGE_LEAGUE_MANAGERS
+    top_k = TOP_K_MANAGERS if large_league else None
+
+    figs = {}
+    if 'rank' in figures:
+        with timed('analysis', step='ranking'):
+            running_rank = create_ranking_df(manager_df, 'total_points', manager_index=manager_index)
+        with timed('plot', figure='rank'):
+            figs['rank'] = league_ranking(running_rank, top_k)
+    if 'total_points' in figures:
+        with timed('analysis', step='total_points'):
+            total_points = create_ranking_df(manager_df, 'total_points', rank=False, manager_index=manager_index)
+        with timed('plot', figure='total_points'):
+            figs['total_points'] = league_ts_plot(total_points, 'Total Points', top_k)
+    if 'team-value' in figures:
+        with timed('analysis', step='team_value'):
+            team_value = create_ranking_df(manager_df, 'value', rank=False, manager_index=manager_index)
+        with timed('plot', figure='team-value'):
+            figs['team-value'] = league_ts_plot(team_value, 'Team Value', top_k)
+    if 'points-box' in figures:
+        with timed('plot', figure='points-box'):
+            figs['points-box'] = manager_box_plot(manager_df, top_k)
+    return figs
+
+
+def create_gameweek_graphs(manager_df, element_index, gw, figures=GAMEWEEK_FIGURES):
+    """
+    Create the gameweek analysis figures for the selected gameweek
+    :param manager_df: Manager dataframe
+    :param element_index: ElementIndex of the bootstrap snapshot
+    :param gw: selected gameweek
+    :param figures: ids of the figures to build, only the analysis they need is run
+    :return: dict
+    """
+    figs = {}
+    if {'prc-own', 'trans-in', 'trans-out'} & set(figures):
+        with timed('analysis', step='ownership'):
+            own_df = ownership(manager_df)
+            own_df.index = element_index.names(own_df.index)
+        with timed('plot', figure='ownership'):
+            if 'prc-own' in figures:
+                figs['prc-own'] = ownership_bar(own_df, gw)
+            if 'trans-in' in figures:
+                figs['trans-in'] = transfers_bar(own_df, gw, "in")
+            if 'trans-out' in figures:
+                figs['trans-out'] = transfers_bar(own_df, gw, "out")
+    if 'captains' in figures:
+        with timed('analysis', step='captains'):
+            captains = manager_df.loc[manager_df['gw'] == gw, 'captain'].dropna()
+            captains_df = pd.Series(element_index.names(captains)).value_counts()
+            captains_df = captains_df / captains_df.sum() * 100
+        with timed('plot', figure='captains'):
+            figs['captains'] = captaincy_plot(captains_df)
+    if 'man-corr' in figures:
+        with timed('analysis', step='correlation'):
+            gw_df = manager_df[manager_df['gw'] == gw]
+            corr_managers = None
+            if manager_df['manager'].nunique() > LARGE_LEAGUE_MANAGERS:
+                corr_managers = gw_df.nlargest(CORR_SAMPLE_MANAGERS, 'total_points')['manager']
+            player_corr, manager_corr = create_corr_matrices(index_by_element(gw_df), gw, managers=corr_managers)
+        with timed('plot', figure='man-corr'):
+            figs['man-corr'] = manager_corr_heatmap(manager_corr)
+    return figs
+
+
+def create_aggregate_graphs(aggregates, element_index, gw, gw_range=None, figures=AGGREGATE_FIGURES):
+    """
+    Create figures from a league's aggregate tables rather than its manager rows: the materialised tables of a
+    loaded league, or the running aggregates of one still loading
+    :param aggregates: AggregateSnapshot, with squads for gw if 'man-corr' is wanted
+    :param element_index: ElementIndex of the bootstrap snapshot
+    :param gw: selected gameweek
+    :param gw_range: (first, last) gameweek of the season figures
+    :param figures: ids of the figures to build, only the analysis they need is run
+    :return: dict
+    """
+    top_k = TOP_K_MANAGERS if aggregates.n_managers_in(gw_range) > LARGE_LEAGUE_MANAGERS else None
+    figs = {}
+    if 'rank' in figures:
+        with timed('analysis', step='ranking'):
+            running_rank = aggregates.running_rank(gw_range)
+        with timed('plot', figure='rank'):
+            figs['rank'] = league_ranking(running_rank, top_k)
+    if 'total_points' in figures:
+        with timed('plot', figure='total_points'):
+            figs['total_points'] = league_ts_plot(aggregates.timeseries('total_points', gw_range), 'Total Points',
+                                                  top_k)
+    if 'team-value' in figures:
+        with timed('plot', figure='team-value'):
+            figs['team-value'] = league_ts_plot(aggregates.timeseries('value', gw_range), 'Team Value', top_k)
+    if 'points-box' in figures:
+        with timed('plot', figure='points-box'):
+            figs['points-box'] = manager_box_plot(aggregates.rows(gw_range), top_k)
+    own_figures = [fig_id for fig_id in ('prc-own', 'trans-in', 'trans-out') if fig_id in figures]
+    if own_figures:
+        with timed('analysis', step='ownership'):
+            own_df = aggregates.ownership()
+            own_df.index = element_index.names(own_df.index)
+        with timed('plot', figure='ownership'):
+            for fig_id in own_figures:
+                if f'gw{gw}' not in own_df:
+                    # Nobody loaded so far has a squad in the gameweek
+                    figs[fig_id] = go.Figure()
+                elif fig_id == 'prc-own':
+                    figs[fig_id] = ownership_bar(own_df, gw)
+                else:
+                    figs[fig_id] = transfers_bar(own_df, gw, fig_id[len('trans-'):])
+    if 'captains' in figures:
+        with timed('analysis', step='captains'):
+            captains_df = aggregates.captain_share(gw)
+            captains_df.index = element_index.names(captains_df.index)
+        with timed('plot', figure='captains'):
+            figs['captains'] = captaincy_plot(captains_df)
+    if 'man-corr' in figures:
+        with timed('analysis', step='correlation'):
+            membership = aggregates.membership(gw)
+            corr_managers = None
+            if aggregates.n_managers > LARGE_LEAGUE_MANAGERS:
+                corr_managers = membership.rows.nlargest(CORR_SAMPLE_MANAGERS, 'total_points')['manager']
+            player_corr, manager_corr = create_corr_matrices(membership, gw, managers=corr_managers)
+        with timed('plot', figure='man-corr'):
+            figs['man-corr'] = manager_corr_heatmap(manager_corr)
+    return figs
+
+
+def create_graphs(manager_df, element_index, gw):
     """
     Create all plotly fig objects and return in dictionary
     :param manager_df: Manager dataframe
-    :param players_df: players dataframe
+    :param element_index: ElementIndex of the bootstrap snapshot
     :param gw: selected gameweek
     :return: dict
     """
-    def id_to_name(player_id):
-        return players_df[players_df['id'] == player_id]['web_name'].values[0]
-
-    running_rank = create_ranking_df(manager_df, 'total_points')
-    total_points = create_ranking_df(manager_df, 'total_points', rank=False)
-    team_value = create_ranking_df(manager_df, 'value', rank=False)
-    own_df = ownership(manager_df)
-    own_df.index = own_df.index.map(id_to_name)
-    element_df = index_by_element(manager_df)
-    element_df = element_df.rename(columns={x: id_to_name(x) for x in element_df.columns[3:]})
-    player_corr, manager_corr = create_corr_matrices(element_df, gw)
-    captains_df = manager_df[manager_df['gw'] == gw]['captain'].apply(id_to_name).value_counts()
-    captains_df = captains_df / captains_df.sum() * 100
-
-    rank_fig = league_ranking(running_rank)
-    tpoints_fig = league_ts_plot(total_points, 'Total Points')
-    tvalue_fig = league_ts_plot(team_value, 'Team Value')
-    box_fig = manager_box_plot(manager_df)
-    own_fig = ownership_bar(own_df, gw)
-    cap_fig = captaincy_plot(captains_df)
-    trans_in = transfers_bar(own_df, gw, "in")
-    trans_out = transfers_bar(own_df, gw, "out")
-    man_corr_fig = manager_corr_heatmap(manager_corr)
-
-    return {'rank': rank_fig, 'points-box': box_fig, 'prc-own': own_fig, 'captains': cap_fig,
-            'trans-in': trans_in, 'trans-out': trans_out, 'man-corr': man_corr_fig,
-            'total_points':tpoints_fig, 'team-value':tvalue_fig}
+    return {**create_season_graphs(manager_df), **create_gameweek_graphs(manager_df, element_index, gw)}
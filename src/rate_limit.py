@@ -0,0 +1,70 @@
+import time
+import threading
+
+
+class TokenBucket:
+    """
+    Thread safe token bucket. acquire() blocks until a token is available, tokens refill at rate per second
+    up to burst. pause() holds every caller back, e.g. for a server supplied Retry-After.
+    """
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = burst
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                wait = self._paused_until - now
+                if wait <= 0:
+                    if self._tokens >= 1:
+                        self._tokens -= 1
+                        return
+                    wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+    def pause(self, seconds):
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+
+class AdaptiveConcurrencyLimiter:
+    """
+    Caps requests in flight, adjusting the cap to the observed error rate: additive increase on success,
+    multiplicative decrease on throttling or server errors. Used as a context manager around each request.
+    """
+
+    def __init__(self, max_limit, min_limit=1):
+        self.max_limit = max_limit
+        self.min_limit = min_limit
+        self.limit = float(max_limit)
+        self._in_flight = 0
+        self._cond = threading.Condition()
+
+    def __enter__(self):
+        with self._cond:
+            while self._in_flight >= int(self.limit):
+                self._cond.wait()
+            self._in_flight += 1
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        with self._cond:
+            self._in_flight -= 1
+            self._cond.notify()
+
+    def record_success(self):
+        with self._cond:
+            self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+            self._cond.notify()
+
+    def record_failure(self):
+        with self._cond:
+            self.limit = max(self.min_limit, self.limit / 2)
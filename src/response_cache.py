@@ -0,0 +1,93 @@
+import time
+import sqlite3
+import threading
+from pathlib import Path
+
+CACHE_PATH = Path().resolve().joinpath('data', 'http_cache.sqlite')
+# Total size of cached response bodies before least recently used entries are evicted
+MAX_CACHE_BYTES = 256 * 1024 ** 2
+
+FOREVER = float('inf')
+
+
+class ResponseCache:
+    """
+    Persistent, size bounded LRU cache of raw api response bodies, stored in sqlite.
+    Entries carry an expiry time, FOREVER entries never expire and are only removed by eviction.
+    """
+
+    def __init__(self, path=CACHE_PATH, max_bytes=MAX_CACHE_BYTES):
+        self.path = Path(path)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._conn = None
+
+    def _connect(self):
+        if self._conn is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+            self._conn.execute("""CREATE TABLE IF NOT EXISTS responses (
+                                    key TEXT PRIMARY KEY,
+                                    body TEXT NOT NULL,
+                                    size INTEGER NOT NULL,
+                                    expires REAL,
+                                    last_access REAL NOT NULL)""")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS responses_last_access ON responses (last_access)")
+            self._conn.commit()
+        return self._conn
+
+    def get(self, key):
+        """Return cached body for key, or None if missing or expired"""
+        now = time.time()
+        with self._lock:
+            conn = self._connect()
+            row = conn.execute("SELECT body, expires FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None or (row[1] is not None and row[1] < now):
+                self.misses += 1
+                return None
+            conn.execute("UPDATE responses SET last_access = ? WHERE key = ?", (now, key))
+            conn.commit()
+            self.hits += 1
+            return row[0]
+
+    def set(self, key, body, ttl=FOREVER):
+        """Store body under key for ttl seconds, then evict down to max_bytes"""
+        now = time.time()
+        expires = None if ttl == FOREVER else now + ttl
+        with self._lock:
+            conn = self._connect()
+            conn.execute("INSERT OR REPLACE INTO responses (key, body, size, expires, last_access) "
+                         "VALUES (?, ?, ?, ?, ?)", (key, body, len(body), expires, now))
+            self._evict(conn)
+            conn.commit()
+
+    def _evict(self, conn):
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        for key, size in conn.execute("SELECT key, size FROM responses ORDER BY last_access").fetchall():
+            conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+            self.evictions += 1
+            total -= size
+            if total <= self.max_bytes:
+                break
+
+    def clear(self):
+        with self._lock:
+            conn = self._connect()
+            conn.execute("DELETE FROM responses")
+            conn.commit()
+
+    def stats(self):
+        """Hit/miss counters and current footprint"""
+        with self._lock:
+            entries, size = self._connect().execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
+        return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions,
+                'entries': entries, 'bytes': size}
+
+
+response_cache = ResponseCache()
@@ -0,0 +1,52 @@
+import numpy as np
+import pandas as pd
+
+PICK_COLUMNS = [f'P{i}' for i in range(1, 12)] + ['S1', 'S2', 'S3', 'S4']
+CHIPS = ['3xc', 'bboost', 'freehit', 'wildcard', 'manager']
+
+# Column order and dtype of manager_df. Element ids fit in int16; picks and captain are nullable as subs can be
+# missing. Text that repeats on every row is categorical.
+MANAGER_SCHEMA = {
+    'gw': 'int8',
+    'points': 'int16',
+    'total_points': 'int16',
+    'rank': 'Int32',
+    'rank_sort': 'Int32',
+    'overall_rank': 'Int32',
+    'bank': 'int16',
+    'value': 'int16',
+    'event_transfers': 'int8',
+    'event_transfers_cost': 'int16',
+    'points_on_bench': 'int16',
+    **{column: 'Int16' for column in PICK_COLUMNS},
+    'captain': 'Int16',
+    'active_chip': pd.CategoricalDtype(CHIPS),
+    'manager': 'int32',
+    'team_name': 'category',
+}
+
+
+def enforce_manager_schema(manager_df, columns=None):
+    """
+    Return manager_df with exactly the MANAGER_SCHEMA columns, in order and with their dtypes.
+    Missing columns are added as nulls (zero for non nullable integers), unknown columns are dropped.
+    :param manager_df: scraped or stored manager rows
+    :param columns: subset of schema columns to keep, default all
+    :return: typed manager_df
+    """
+    typed = {}
+    for column, dtype in MANAGER_SCHEMA.items():
+        if columns is not None and column not in columns:
+            continue
+        if column in manager_df:
+            values = manager_df[column]
+        else:
+            values = pd.Series(np.nan, index=manager_df.index)
+        if isinstance(dtype, str) and dtype[0] == 'i':
+            values = values.fillna(0)
+        if isinstance(dtype, pd.CategoricalDtype) or dtype == 'category':
+            values = values.astype(object)
+        elif isinstance(dtype, str) and dtype[0] == 'I' and values.dtype == object:
+            values = pd.to_numeric(values)
+        typed[column] = values.astype(dtype)
+    return pd.DataFrame(typed, index=manager_df.index)
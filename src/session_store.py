@@ -0,0 +1,163 @@
+import os
+import time
+import uuid
+import shutil
+import threading
+from pathlib import Path
+
+from app import DATA_STORE
+from metrics import registry
+
+# Total bytes of session directories kept before least recently used sessions are evicted
+SESSION_QUOTA_BYTES = 512 * 1024 ** 2
+# Seconds without access after which a session is removed regardless of the quota
+SESSION_IDLE_TTL = 60 * 60
+# Seconds between janitor sweeps
+SWEEP_INTERVAL = 60
+
+ACCESS_MARKER = '.last_access'
+
+
+def _is_session_dir(path):
+    try:
+        uuid.UUID(path.name)
+    except ValueError:
+        return False
+    return path.is_dir()
+
+
+def _dir_size(path):
+    size = 0
+    for root, dirs, files in os.walk(path):
+        for name in files:
+            try:
+                size += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return size
+
+
+class SessionStore:
+    """
+    Per session scratch directories under root, one per session uuid, bounded by a total disk quota.
+    Last access is tracked in memory and mirrored to a marker file's mtime so it survives a restart.
+    A background janitor removes sessions idle for longer than idle_ttl, then evicts least recently used
+    sessions until the total is under quota_bytes. Directories are created by the janitor thread, or on the
+    first call to path(), so opening a session never waits on the filesystem.
+    """
+
+    def __init__(self, root, quota_bytes=SESSION_QUOTA_BYTES, idle_ttl=SESSION_IDLE_TTL,
+                 sweep_interval=SWEEP_INTERVAL):
+        self.root = Path(root)
+        self.quota_bytes = quota_bytes
+        self.idle_ttl = idle_ttl
+        self.sweep_interval = sweep_interval
+        self.evictions = 0
+        self.expirations = 0
+        self._access = {}
+        self._pending = set()
+        self._sizes = {}
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+
+    def touch(self, session_id):
+        """Record an access to session_id, queueing its directory for creation if it is new"""
+        if session_id is None:
+            return
+        with self._lock:
+            if session_id not in self._access:
+                self._pending.add(session_id)
+                self._wake.set()
+            self._access[session_id] = time.time()
+
+    def path(self, session_id):
+        """Directory of session_id, created if needed"""
+        self.touch(session_id)
+        path = self.root.joinpath(session_id)
+        path.mkdir(parents=True, exist_ok=True)
+        return path
+
+    def _last_access(self, path):
+        last_access = self._access.get(path.name)
+        if last_access is not None:
+            return last_access
+        marker = path.joinpath(ACCESS_MARKER)
+        return (marker if marker.exists() else path).stat().st_mtime
+
+    def _create_pending(self):
+        with self._lock:
+            pending, self._pending = self._pending, set()
+        for session_id in pending:
+            path = self.root.joinpath(session_id)
+            path.mkdir(parents=True, exist_ok=True)
+            path.joinpath(ACCESS_MARKER).touch()
+
+    def _remove(self, path):
+        shutil.rmtree(path, ignore_errors=True)
+        with self._lock:
+            self._access.pop(path.name, None)
+            self._sizes.pop(path.name, None)
+
+    def sweep(self):
+        """Create queued directories, expire idle sessions and evict down to the quota"""
+        self._create_pending()
+        if not self.root.exists():
+            return
+        now = time.time()
+        sessions = []
+        for path in filter(_is_session_dir, self.root.iterdir()):
+            try:
+                last_access = self._last_access(path)
+            except OSError:
+                continue
+            if now - last_access > self.idle_ttl:
+                self._remove(path)
+                self.expirations += 1
+                continue
+            if path.name in self._access:
+                marker = path.joinpath(ACCESS_MARKER)
+                marker.touch()
+                os.utime(marker, (last_access, last_access))
+            sessions.append((last_access, path, _dir_size(path)))
+
+        sizes = {path.name: size for last_access, path, size in sessions}
+        total = sum(sizes.values())
+        for last_access, path, size in sorted(sessions, key=lambda session: session[0]):
+            if total <= self.quota_bytes:
+                break
+            self._remove(path)
+            sizes.pop(path.name)
+            total -= size
+            self.evictions += 1
+        with self._lock:
+            self._sizes = sizes
+
+    def stats(self):
+        with self._lock:
+            return {'sessions': len(self._sizes), 'bytes': sum(self._sizes.values()), 'quota_bytes': self.quota_bytes,
+                    'evictions': self.evictions, 'expirations': self.expirations}
+
+    def _run(self):
+        next_sweep = time.monotonic()
+        while True:
+            self._wake.wait(max(next_sweep - time.monotonic(), 0))
+            self._wake.clear()
+            try:
+                if time.monotonic() >= next_sweep:
+                    next_sweep = time.monotonic() + self.sweep_interval
+                    self.sweep()
+                else:
+                    self._create_pending()
+            except Exception:
+                pass
+
+    def start(self):
+        """Start the background janitor thread"""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='session-janitor', daemon=True)
+            self._thread.start()
+
+
+session_store = SessionStore(DATA_STORE)
+registry.register_gauges('session_store', session_store.stats)
@@ -0,0 +1,74 @@
+import time
+import threading
+from collections import OrderedDict
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls with the same key into one execution: callers arriving while a call is in flight
+    wait for it and share its result or exception. Successful results are kept for ttl seconds, up to
+    max_entries, so callers arriving just after also share them. Results are shared, callers must not mutate them.
+    """
+
+    def __init__(self, ttl=0, max_entries=1024):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.calls = 0
+        self.shared = 0
+        self._in_flight = {}
+        self._results = OrderedDict()
+        self._lock = threading.Lock()
+
+    def do(self, key, func, *args, **kwargs):
+        """Return func(*args, **kwargs), sharing the call with any identical one in flight or recently finished"""
+        with self._lock:
+            cached = self._results.get(key)
+            if cached is not None and cached[0] > time.monotonic():
+                self.shared += 1
+                return cached[1]
+            call = self._in_flight.get(key)
+            leader = call is None
+            if leader:
+                call = self._in_flight[key] = _Call()
+                self.calls += 1
+            else:
+                self.shared += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = func(*args, **kwargs)
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._in_flight[key]
+                if call.error is None and self.ttl > 0:
+                    self._results[key] = (time.monotonic() + self.ttl, call.result)
+                    self._results.move_to_end(key)
+                    while len(self._results) > self.max_entries:
+                        self._results.popitem(last=False)
+            call.done.set()
+        return call.result
+
+    def forget(self, key):
+        """Drop any cached result for key"""
+        with self._lock:
+            self._results.pop(key, None)
+
+    def stats(self):
+        with self._lock:
+            return {'calls': self.calls, 'shared': self.shared, 'in_flight': len(self._in_flight),
+                    'cached': len(self._results)}
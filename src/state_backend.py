@@ -0,0 +1,242 @@
+import os
+import json
+import time
+import shutil
+import sqlite3
+import threading
+from pathlib import Path
+
+try:
+    import fcntl
+except ImportError:
+    # Not available on Windows, leases are then only exclusive within one process
+    fcntl = None
+
+from app import DATA_STORE
+
+# 'file' keeps state under FPL_STATE_PATH, point it at a shared directory to run several nodes.
+# 'sqlite' keeps it in one database file, shared by every worker process on a host.
+STATE_BACKEND = os.environ.get('FPL_STATE_BACKEND', 'file')
+STATE_PATH = Path(os.environ.get('FPL_STATE_PATH', DATA_STORE))
+
+
+class StateBackend:
+    """
+    Storage for state shared between worker processes: manager data, bootstrap snapshots and job progress.
+    Keys are '/' separated strings. Values are bytes blobs or append only logs of text lines, and leases give one
+    owner at a time the right to run a piece of work.
+    """
+
+    def get(self, key):
+        """Blob stored under key, or None"""
+        raise NotImplementedError
+
+    def put(self, key, value):
+        """Store bytes value under key, replacing it atomically"""
+        raise NotImplementedError
+
+    def delete(self, key):
+        raise NotImplementedError
+
+    def delete_prefix(self, prefix):
+        """Remove every blob, log and lease under prefix"""
+        raise NotImplementedError
+
+    def append(self, key, line):
+        """Append a line of text to the log under key"""
+        raise NotImplementedError
+
+    def lines(self, key):
+        """Lines of the log under key, oldest first"""
+        raise NotImplementedError
+
+    def version(self, key):
+        """Token that changes whenever the log under key is appended to or removed, '' if there is no log"""
+        raise NotImplementedError
+
+    def claim(self, key, owner, ttl):
+        """Take or renew the lease under key for ttl seconds. False if another owner holds an unexpired lease."""
+        raise NotImplementedError
+
+    def release(self, key, owner):
+        """Give up the lease under key if owner holds it"""
+        raise NotImplementedError
+
+    def get_json(self, key):
+        value = self.get(key)
+        return None if value is None else json.loads(value)
+
+    def put_json(self, key, obj):
+        self.put(key, json.dumps(obj).encode())
+
+
+class LocalFileBackend(StateBackend):
+    """State as files under root. On a shared directory (e.g. an NFS mount) it serves several nodes."""
+
+    def __init__(self, root=STATE_PATH):
+        self.root = Path(root)
+        self._lock = threading.Lock()
+
+    def _path(self, key):
+        if '..' in key.split('/'):
+            raise ValueError(f"Invalid state key {key}")
+        return self.root.joinpath(*key.split('/'))
+
+    def get(self, key):
+        try:
+            return self._path(key).read_bytes()
+        except FileNotFoundError:
+            return None
+
+    def put(self, key, value):
+        path = self._path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(f'{path.name}.{os.getpid()}.{threading.get_ident()}.tmp')
+        tmp.write_bytes(value)
+        os.replace(tmp, path)
+
+    def delete(self, key):
+        self._path(key).unlink(missing_ok=True)
+
+    def delete_prefix(self, prefix):
+        path = self._path(prefix)
+        if path.is_dir():
+            shutil.rmtree(path, ignore_errors=True)
+        else:
+            path.unlink(missing_ok=True)
+
+    def append(self, key, line):
+        path = self._path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, 'a') as fh:
+            fh.write(line + '\n')
+
+    def lines(self, key):
+        try:
+            with open(self._path(key)) as fh:
+                return [line.rstrip('\n') for line in fh if line.strip()]
+        except FileNotFoundError:
+            return []
+
+    def version(self, key):
+        try:
+            stat = self._path(key).stat()
+        except FileNotFoundError:
+            return ''
+        return f'{stat.st_size}-{stat.st_mtime_ns}'
+
+    def _update_lease(self, key, update):
+        path = self._path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with self._lock, open(path.with_name(path.name + '.lock'), 'a') as lock_fh:
+            if fcntl is not None:
+                fcntl.flock(lock_fh, fcntl.LOCK_EX)
+            try:
+                return update(self.get_json(key))
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock_fh, fcntl.LOCK_UN)
+
+    def claim(self, key, owner, ttl):
+        def update(lease):
+            if lease is not None and lease['owner'] != owner and lease['expires'] > time.time():
+                return False
+            self.put_json(key, {'owner': owner, 'expires': time.time() + ttl})
+            return True
+        return self._update_lease(key, update)
+
+    def release(self, key, owner):
+        def update(lease):
+            if lease is not None and lease['owner'] == owner:
+                self.delete(key)
+        self._update_lease(key, update)
+
+
+class SqliteBackend(StateBackend):
+    """State in a single sqlite database in WAL mode, shared by every worker process on the host"""
+
+    def __init__(self, path=STATE_PATH.joinpath('state.sqlite')):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        self._conn = None
+
+    def _connect(self):
+        if self._conn is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._conn = sqlite3.connect(str(self.path), timeout=30, check_same_thread=False,
+                                         isolation_level=None)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("CREATE TABLE IF NOT EXISTS blobs (key TEXT PRIMARY KEY, value BLOB NOT NULL)")
+            self._conn.execute("""CREATE TABLE IF NOT EXISTS logs (
+                                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                                    key TEXT NOT NULL,
+                                    line TEXT NOT NULL)""")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS logs_key ON logs (key, id)")
+            self._conn.execute("""CREATE TABLE IF NOT EXISTS leases (
+                                    key TEXT PRIMARY KEY,
+                                    owner TEXT NOT NULL,
+                                    expires REAL NOT NULL)""")
+        return self._conn
+
+    def _execute(self, sql, params=()):
+        with self._lock:
+            return self._connect().execute(sql, params).fetchall()
+
+    def get(self, key):
+        rows = self._execute("SELECT value FROM blobs WHERE key = ?", (key,))
+        return bytes(rows[0][0]) if rows else None
+
+    def put(self, key, value):
+        self._execute("INSERT OR REPLACE INTO blobs (key, value) VALUES (?, ?)", (key, sqlite3.Binary(value)))
+
+    def delete(self, key):
+        self._execute("DELETE FROM blobs WHERE key = ?", (key,))
+
+    def delete_prefix(self, prefix):
+        with self._lock:
+            conn = self._connect()
+            conn.execute("BEGIN IMMEDIATE")
+            for table in ('blobs', 'logs', 'leases'):
+                conn.execute(f"DELETE FROM {table} WHERE substr(key, 1, ?) = ?", (len(prefix), prefix))
+            conn.execute("COMMIT")
+
+    def append(self, key, line):
+        self._execute("INSERT INTO logs (key, line) VALUES (?, ?)", (key, line))
+
+    def lines(self, key):
+        return [row[0] for row in self._execute("SELECT line FROM logs WHERE key = ? ORDER BY id", (key,))]
+
+    def version(self, key):
+        count, last_id = self._execute("SELECT COUNT(*), MAX(id) FROM logs WHERE key = ?", (key,))[0]
+        return f'{count}-{last_id}' if count else ''
+
+    def claim(self, key, owner, ttl):
+        now = time.time()
+        with self._lock:
+            conn = self._connect()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = conn.execute("SELECT owner, expires FROM leases WHERE key = ?", (key,)).fetchone()
+                if row is not None and row[0] != owner and row[1] > now:
+                    return False
+                conn.execute("INSERT OR REPLACE INTO leases (key, owner, expires) VALUES (?, ?, ?)",
+                             (key, owner, now + ttl))
+                return True
+            finally:
+                conn.execute("COMMIT")
+
+    def release(self, key, owner):
+        self._execute("DELETE FROM leases WHERE key = ? AND owner = ?", (key, owner))
+
+
+BACKENDS = {'file': LocalFileBackend, 'sqlite': SqliteBackend}
+
+
+def create_backend(name=STATE_BACKEND):
+    """Backend named by FPL_STATE_BACKEND"""
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown state backend {name}, expected one of {sorted(BACKENDS)}")
+    return BACKENDS[name]()
+
+
+state_backend = create_backend()
@@ -0,0 +1,175 @@
+import re
+import json
+import time
+import random
+import argparse
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+PAGE_SIZE = 50
+N_ELEMENTS = 600
+N_TEAMS = 20
+
+
+class StubFPLData:
+    """
+    Deterministic synthetic FPL api payloads. Leagues are looked up in league_sizes (league id -> number of
+    managers) and every entry's picks are seeded by (entry, gameweek), so repeated requests agree.
+    """
+
+    def __init__(self, league_sizes, n_gws=38, current_gw=None):
+        self.league_sizes = league_sizes
+        self.n_gws = n_gws
+        self.current_gw = current_gw or n_gws
+        self.deadline_start = time.time() - self.current_gw * 7 * 24 * 3600
+
+    def standings(self, league_id, page):
+        if league_id not in self.league_sizes:
+            return None
+        size = self.league_sizes[league_id]
+        first = (page - 1) * PAGE_SIZE
+        entries = range(first + 1, min(first + PAGE_SIZE, size) + 1)
+        results = [{'id': entry, 'entry': league_id * 100000 + entry, 'entry_name': f'Team {entry}',
+                    'player_name': f'Manager {entry}', 'rank': entry, 'last_rank': entry, 'rank_sort': entry,
+                    'total': 2000 - entry, 'event_total': 50} for entry in entries]
+        return {'league': {'id': league_id, 'name': f'Stub League {league_id}'},
+                'standings': {'has_next': first + PAGE_SIZE < size, 'page': page, 'results': results}}
+
+    def picks(self, entry_id, gw):
+        if not 1 <= gw <= self.current_gw:
+            return None
+        rng = random.Random(entry_id * 100 + gw)
+        elements = rng.sample(range(1, N_ELEMENTS + 1), 15)
+        captain = rng.randrange(11)
+        points = rng.randint(20, 110)
+        return {
+            'active_chip': rng.choice([None] * 20 + ['bboost', 'freehit', 'wildcard', '3xc']),
+            'automatic_subs': [],
+            'entry_history': {'event': gw, 'points': points, 'total_points': points + 55 * (gw - 1),
+                              'rank': rng.randint(1, 8000000), 'overall_rank': rng.randint(1, 8000000),
+                              'bank': rng.randint(0, 50), 'value': 1000 + gw + rng.randint(-20, 20),
+                              'event_transfers': rng.randint(0, 2), 'event_transfers_cost': 0,
+                              'points_on_bench': rng.randint(0, 20)},
+            'picks': [{'element': element, 'position': position, 'multiplier': 1 if position <= 11 else 0,
+                       'is_captain': position - 1 == captain, 'is_vice_captain': False}
+                      for position, element in enumerate(elements, start=1)],
+        }
+
+    def bootstrap_static(self):
+        events = [{'id': gw, 'name': f'Gameweek {gw}', 'finished': gw < self.current_gw,
+                   'data_checked': gw < self.current_gw, 'is_current': gw == self.current_gw,
+                   'is_next': gw == self.current_gw + 1,
+                   'deadline_time_epoch': int(self.deadline_start + (gw - 1) * 7 * 24 * 3600)}
+                  for gw in range(1, self.n_gws + 1)]
+        teams = [{'id': team, 'name': f'Club {team}', 'short_name': f'C{team:02d}'} for team in range(1, N_TEAMS + 1)]
+        elements = [{'id': element, 'web_name': f'Player {element}', 'team': element % N_TEAMS + 1,
+                     'element_type': element % 4 + 1, 'now_cost': 45 + element % 80}
+                    for element in range(1, N_ELEMENTS + 1)]
+        return {'events': events, 'teams': teams, 'elements': elements}
+
+    def fixtures(self):
+        return [{'id': gw * 10 + match, 'event': gw, 'finished': gw < self.current_gw,
+                 'team_h': 2 * match + 1, 'team_a': 2 * match + 2}
+                for gw in range(1, self.n_gws + 1) for match in range(N_TEAMS // 2)]
+
+
+class StubFPLServer:
+    """
+    Local stand in for the FPL api, serving StubFPLData with configurable latency and failure rates.
+    error_rate responses are 503s, throttle_rate responses are 429s with a Retry-After header.
+    """
+
+    def __init__(self, data, port=0, latency=0.0, error_rate=0.0, throttle_rate=0.0, retry_after=1):
+        self.data = data
+        self.latency = latency
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.retry_after = retry_after
+        self.requests = 0
+        self._httpd = ThreadingHTTPServer(('127.0.0.1', port), self._handler())
+        self._httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        return f'http://127.0.0.1:{self._httpd.server_address[1]}/api/'
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                server.requests += 1
+                if server.latency:
+                    time.sleep(server.latency)
+                roll = random.random()
+                if roll < server.throttle_rate:
+                    return self._send(429, {'detail': 'throttled'}, {'Retry-After': str(server.retry_after)})
+                if roll < server.throttle_rate + server.error_rate:
+                    return self._send(503, {'detail': 'unavailable'})
+                payload = server.route(self.path)
+                if payload is None:
+                    return self._send(404, {'detail': 'Not found.'})
+                return self._send(200, payload)
+
+            def _send(self, status, payload, headers=None):
+                body = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def route(self, path):
+        """Payload for a request path, or None for an unknown route"""
+        parsed = urlparse(path)
+        route = re.sub('/+', '/', parsed.path)
+        match = re.fullmatch(r'/api/leagues-classic/(\d+)/standings/?', route)
+        if match:
+            page = int(parse_qs(parsed.query).get('page_standings', ['1'])[0])
+            return self.data.standings(int(match.group(1)), page)
+        match = re.fullmatch(r'/api/entry/(\d+)/event/(\d+)/picks/?', route)
+        if match:
+            return self.data.picks(int(match.group(1)), int(match.group(2)))
+        if re.fullmatch(r'/api/bootstrap-static/?', route):
+            return self.data.bootstrap_static()
+        if re.fullmatch(r'/api/fixtures/?', route):
+            return self.data.fixtures()
+        return None
+
+    def start(self):
+        """Serve from a background thread, returning the api base url"""
+        self._thread = threading.Thread(target=self._httpd.serve_forever, name='stub-fpl', daemon=True)
+        self._thread.start()
+        return self.url
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description="Local stand in for the FPL api")
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--league-size', type=int, action='append', default=[],
+                        help="managers in league 1, 2, ... (repeat for more leagues)")
+    parser.add_argument('--gameweeks', type=int, default=38)
+    parser.add_argument('--latency', type=float, default=0.0, help="seconds added to every response")
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--throttle-rate', type=float, default=0.0)
+    args = parser.parse_args()
+
+    sizes = {league_id: size for league_id, size in enumerate(args.league_size or [50], start=1)}
+    stub = StubFPLServer(StubFPLData(sizes, args.gameweeks), port=args.port, latency=args.latency,
+                         error_rate=args.error_rate, throttle_rate=args.throttle_rate)
+    print(f"Serving {sizes} on {stub.url}, set FPL_API_URL to use it")
+    stub._httpd.serve_forever()